@@ -0,0 +1,140 @@
+"""
+Chunked, multi-process batch scoring of large feature CSV files.
+
+The input is streamed in fixed-size chunks, chunks are scored on a process
+pool (each worker loads the model once), and the decoded labels are
+written to a CSV or Parquet file in input order. At most a few chunks are
+in flight at any time, so peak memory does not depend on the input size.
+
+    python simple_ids2.py --batch output_features.csv --output labels.csv
+"""
+import csv
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from dataset import FEATURE_COLUMNS
+
+# État propre à chaque processus worker (chargé une seule fois)
+_worker = {}
+
+
+def _init_worker(model_path, encoder_path, feature_columns, rules_path=None):
+    if os.path.isdir(model_path):
+        # Forêt exportée en tableaux .npy : mappée en mémoire et partagée
+        # entre tous les workers au lieu d'une copie par processus
+        from flat_forest import FlatForest
+        model = FlatForest.load_arrays(model_path, mmap_mode='r')
+    else:
+        model = joblib.load(model_path)
+    if hasattr(model, 'n_jobs'):
+        # Le parallélisme vient déjà du pool de processus
+        model.n_jobs = 1
+    encoder = joblib.load(encoder_path)
+    if rules_path:
+        from rule_fastpath import RuleFastPath
+        model = RuleFastPath.from_file(rules_path, model, feature_columns, encoder)
+    _worker['model'] = model
+    _worker['encoder'] = encoder
+    _worker['columns'] = feature_columns
+
+
+def _score_chunk(X):
+    frame = pd.DataFrame(X, columns=_worker['columns'])
+    return _worker['encoder'].inverse_transform(_worker['model'].predict(frame))
+
+
+class _LabelWriter:
+    """Appends label chunks to a CSV file, or to a Parquet file if the path ends in .parquet."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        if self.parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+            self._pa, self._pq = pa, pq
+        else:
+            self._file = open(path, 'w', newline='')
+            # Le module csv met entre guillemets les étiquettes contenant , " ou \n
+            self._csv = csv.writer(self._file, lineterminator='\n')
+            self._csv.writerow(['label'])
+
+    def write(self, labels):
+        if self.parquet:
+            table = self._pa.table({'label': self._pa.array(np.asarray(labels).astype(str),
+                                                            type=self._pa.string())})
+            if self._writer is None:
+                self._writer = self._pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            self._csv.writerows([label] for label in labels)
+
+    def close(self):
+        if self.parquet:
+            if self._writer is None:
+                # Entrée vide : fichier Parquet vide, avec le schéma
+                self._writer = self._pq.ParquetWriter(
+                    self.path, self._pa.schema([('label', self._pa.string())]))
+            self._writer.close()
+        else:
+            self._file.close()
+
+
+def score_file(model_path, encoder_path, input_path, output_path,
+               chunksize=100_000, n_jobs=None, feature_columns=FEATURE_COLUMNS,
+               rules_path=None):
+    """
+    Score `input_path` chunk by chunk and write one label per row to
+    `output_path`, preserving the input order. Returns the number of
+    rows scored. `model_path` is a joblib-pickled model, or a directory
+    written by FlatForest.save_arrays() to share one memory-mapped copy
+    of the forest between the workers. With `rules_path` (certain_rules.txt),
+    rows covered by the certain rules skip the model (rule_fastpath.py).
+    """
+    feature_columns = list(feature_columns)
+    header = pd.read_csv(input_path, nrows=0).columns
+    missing = [col for col in feature_columns if col not in header]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    # Deux chunks par worker en vol au maximum : mémoire bornée
+    max_pending = 2 * n_jobs
+    reader = pd.read_csv(input_path, usecols=feature_columns, chunksize=chunksize,
+                         dtype={col: np.float32 for col in feature_columns})
+
+    writer = _LabelWriter(output_path)
+    n_rows = 0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(model_path, encoder_path, feature_columns,
+                                           rules_path)) as pool:
+            pending = deque()
+            for chunk in reader:
+                pending.append(pool.submit(_score_chunk, chunk[feature_columns].to_numpy()))
+                if len(pending) >= max_pending:
+                    labels = pending.popleft().result()
+                    writer.write(labels)
+                    n_rows += len(labels)
+            while pending:
+                labels = pending.popleft().result()
+                writer.write(labels)
+                n_rows += len(labels)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = n_rows / elapsed if elapsed > 0 else 0.0
+    print(f"[*] {n_rows} rows scored in {elapsed:.2f}s ({rate:.0f} rows/sec) -> {output_path}")
+    return n_rows
@@ -0,0 +1,230 @@
+"""
+Offline benchmark suite for the rule pipeline and inference hot paths.
+
+Every stage runs on a synthetic NSL-KDD shaped dataset (dataset.make_synthetic),
+so no CSV, chain or running server is needed (server.py is imported against an
+empty in-memory chain, with its files in a temporary directory):
+
+  rule_extraction_export_text  export_text rendering of every tree (extract_rules.py, historical)
+  rule_extraction_tree_arrays  root-to-leaf extraction from tree_ (rule_extraction.forest_rules)
+  uncertain_rule_counting      count_forest_rules + split_rules (clients, step 4)
+  sample_weighting_eval_loop   the clients' original per-row eval() weighting loop (baseline)
+  sample_weighting             compute_sample_weights (clients, step 6), same rows and rules
+  correct_rules_matching       server.match_uncertain_rules against 10k/100k/1M stored rules
+  correct_rules_request        full POST /correct_rules (caches cleared before each call)
+  batch_prediction             simple_ids model.predict on a batch of flows
+
+    python benchmarks.py --output bench.json
+    python benchmarks.py --quick --output new.json --compare bench.json
+
+Results (best wall time over --repeat runs) are written to JSON so two
+runs can be compared; --compare prints the ratio per benchmark.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+
+import numpy as np
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import export_text
+
+from dataset import FEATURE_COLUMNS, TARGET_COLUMN, make_synthetic
+from rule_extraction import count_forest_rules, forest_rules, split_rules
+from rule_index import RuleIndex
+from rule_weights import compute_sample_weights
+
+
+def timed(fn, repeat):
+    """Best wall time of `repeat` calls of fn(), and its last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def synthetic_stored_rules(n_rules, seed=0):
+    """
+    Rule strings in the canonical "if ... then class: ..." format, drawn
+    from a small grid of splits so that many of them share prefixes,
+    like paths of trees trained on the same data.
+    """
+    rng = random.Random(seed)
+    splits = [f"{f} {op} {t:.2f}" for f in FEATURE_COLUMNS for op in ('<=', '>')
+              for t in (0.05, 0.5, 28.5, 120.0, 255.0)]
+    rules = []
+    for _ in range(n_rules):
+        conds = rng.sample(splits, rng.randint(2, 8))
+        rules.append(f"if {' and '.join(conds)} then class: {rng.choice(['normal', 'malicious'])}")
+    return rules
+
+
+def uncertain_from(stored, n, seed=0):
+    """Uncertain rules whose conditions are prefixes of some stored rules."""
+    rng = random.Random(seed)
+    out = []
+    for rule in rng.sample(stored, min(n, len(stored))):
+        conds = rule.split(" then")[0][3:].split(" and ")
+        out.append(f"if {' and '.join(conds[:rng.randint(1, len(conds))])} then class: normal")
+    return out
+
+
+def eval_sample_weights(X, rules, factor=1.5):
+    """The clients' original step 6: eval() of every rule on every row."""
+    weights = [1.0] * len(X)
+    for i, (_, row) in enumerate(X.iterrows()):
+        for rule in rules:
+            cond = rule.split(" then")[0].replace("if ", "")
+            try:
+                if eval(cond, {}, row.to_dict()):
+                    weights[i] *= factor
+            except Exception:
+                pass
+    return weights
+
+
+def load_server(work_dir):
+    """
+    Import server.py against an empty in-memory chain, with its corrected
+    rule log in `work_dir`. The configuration is read at import time,
+    so it is set in this benchmark process's environment.
+    """
+    os.environ.update({
+        'CHAIN_BACKEND': 'memory',
+        'RULES_CONTRACT_ADDRESS': '0xBenchmarks',
+        'CORRECTED_RULES_LOG': os.path.join(work_dir, 'corrected_rules.log'),
+        'RULE_INDEX_FILE': '',
+    })
+    import server
+    return server
+
+
+def run(rows, trees, rule_sizes, uncertain_per_request, repeat, seed,
+        weight_rows=1000, weight_rules=100):
+    results = []
+
+    def record(name, seconds, items, unit, **params):
+        results.append({'name': name, 'params': params, 'seconds': seconds,
+                        'throughput': items / seconds if seconds > 0 else None,
+                        'unit': unit})
+        print(f"{name:<30} {params!s:<45} {seconds * 1000:10.1f} ms  "
+              f"({items / seconds:,.0f} {unit}/s)")
+
+    df = make_synthetic(rows, seed=seed)
+    X, y = df[FEATURE_COLUMNS], df[TARGET_COLUMN]
+    rf = RandomForestClassifier(n_estimators=trees, random_state=seed, n_jobs=-1)
+    rf.fit(X, y)
+    n_nodes = sum(est.tree_.node_count for est in rf.estimators_)
+
+    t, _ = timed(lambda: [export_text(est, feature_names=FEATURE_COLUMNS)
+                          for est in rf.estimators_], repeat)
+    record('rule_extraction_export_text', t, n_nodes, 'nodes', trees=trees, rows=rows)
+
+    t, per_tree = timed(lambda: forest_rules(rf, FEATURE_COLUMNS), repeat)
+    record('rule_extraction_tree_arrays', t, n_nodes, 'nodes', trees=trees, rows=rows)
+
+    def count_uncertain():
+        counts = count_forest_rules(rf, FEATURE_COLUMNS, prefixes=True)
+        return counts, split_rules(counts, trees, 0.5)[1]
+
+    t, (counts, _) = timed(count_uncertain, repeat)
+    record('uncertain_rule_counting', t, sum(counts.values()), 'rules', trees=trees, rows=rows)
+
+    # Les règles corrigées sont des chemins de la forêt : elles matchent des lignes.
+    # La boucle eval() d'origine est très lente : les deux versions tournent sur
+    # le même sous-ensemble de lignes et de règles pour être comparables
+    corrected = [r for rules in per_tree[:5] for r in rules][:weight_rules]
+    X_weights = X.iloc[:weight_rows]
+    t_eval, expected = timed(lambda: eval_sample_weights(X_weights, corrected, 1.5), 1)
+    record('sample_weighting_eval_loop', t_eval, len(X_weights) * len(corrected), 'row-rules',
+           rows=len(X_weights), rules=len(corrected))
+    t, weights = timed(lambda: compute_sample_weights(X_weights, corrected, factor=1.5), repeat)
+    record('sample_weighting', t, len(X_weights) * len(corrected), 'row-rules',
+           rows=len(X_weights), rules=len(corrected))
+    if not np.allclose(weights, expected):
+        print("Warning: compute_sample_weights differs from the eval() loop")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        server = load_server(work_dir)
+        client = server.app.test_client()
+        for n_rules in rule_sizes:
+            stored = synthetic_stored_rules(n_rules, seed)
+            t_build, index = timed(lambda: RuleIndex(stored, f"bench{n_rules}"), 1)
+            record('correct_rules_index_build', t_build, n_rules, 'rules', stored=n_rules)
+            server.RULE_INDEX = server.CONTINUOUS_RULES = index
+            server.RULES_VERSION = index.version
+            request = uncertain_from(stored, uncertain_per_request, seed)
+            t, _ = timed(lambda: server.match_uncertain_rules(request), repeat)
+            record('correct_rules_matching', t, len(request), 'uncertain',
+                   stored=n_rules, uncertain=len(request))
+
+            def post_request():
+                server.MATCH_CACHE.clear()
+                server.RESPONSE_CACHE.clear()
+                resp = client.post('/correct_rules', json={'uncertain_rules': request})
+                assert resp.status_code == 200, resp.status_code
+            t, _ = timed(post_request, repeat)
+            record('correct_rules_request', t, len(request), 'uncertain',
+                   stored=n_rules, uncertain=len(request))
+
+    t, _ = timed(lambda: rf.predict(X), repeat)
+    record('batch_prediction', t, len(X), 'rows', rows=rows, trees=trees)
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['name'], json.dumps(r['params'], sort_keys=True)): r
+                    for r in json.load(f)['results']}
+    print(f"\n=== Comparison with {baseline_path} (new / old time) ===")
+    for r in results:
+        old = baseline.get((r['name'], json.dumps(r['params'], sort_keys=True)))
+        if old:
+            print(f"{r['name']:<30} {r['params']!s:<45} x{r['seconds'] / old['seconds']:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the rule pipeline hot paths")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--rule-sizes", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--uncertain", type=int, default=500,
+                        help="uncertain rules per simulated /correct_rules request")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true",
+                        help="small sizes, for a fast smoke run")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", metavar="BASELINE_JSON")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.rows, args.trees, args.rule_sizes, args.repeat = 20_000, 20, [10_000], 1
+
+    results = run(args.rows, args.trees, args.rule_sizes, args.uncertain,
+                  args.repeat, args.seed)
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,334 @@
+"""
+Pluggable chain backend for server.py and uploadrules.py.
+
+CHAIN_BACKEND selects where the RandomForestRules contract lives:
+
+  web3 (default)      a real node (Ganache) over JSON-RPC at CHAIN_URL
+  memory              an in-process simulated chain
+  sqlite:<path>       a simulated chain persisted in a SQLite file, so that
+                      uploadrules.py and server.py can share it offline
+
+The simulated chain implements the contract surface of the embedded ABI
+(addRule, getRule, getRuleCount, ruleCount, rules, owner and the RuleAdded
+event) behind the same web3 calls the scripts use: .call(), .transact(),
+eth.wait_for_transaction_receipt, eth.get_transaction_count, ... Its
+timing is configurable to measure throughput realistically:
+
+  CHAIN_BLOCK_TIME    seconds between blocks (0 = mine instantly, like Ganache)
+  CHAIN_RPC_LATENCY   seconds added to every RPC round trip
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+GANACHE_URL = "http://127.0.0.1:8545"
+
+# Fonctions du contrat que le backend simulé doit fournir
+REQUIRED_FUNCTIONS = ('addRule', 'getRule', 'getRuleCount')
+
+
+class ContractLogicError(Exception):
+    """A call or transaction reverted in the simulated contract."""
+
+
+class AttributeDict(dict):
+    """dict with attribute access, like web3's receipts and event logs."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class SimulatedChain:
+    """
+    Simulated node holding RandomForestRules contracts in SQLite.
+
+    Transactions are mined at the next block boundary (immediately when
+    block_time is 0); state changes and RuleAdded events only become
+    visible once their block is mined. Every RPC sleeps rpc_latency.
+    """
+
+    def __init__(self, path=':memory:', block_time=0.0, rpc_latency=0.0, n_accounts=10):
+        self.block_time = block_time
+        self.rpc_latency = rpc_latency
+        self.accounts = [
+            '0x' + hashlib.sha256(f"account-{i}".encode()).hexdigest()[:40]
+            for i in range(n_accounts)
+        ]
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS rules (
+                contract TEXT, id INTEGER, content TEXT, block INTEGER,
+                PRIMARY KEY (contract, id));
+            CREATE TABLE IF NOT EXISTS nonces (account TEXT PRIMARY KEY, nonce INTEGER);
+        """)
+        self._pending = []     # (mine_time, tx_hash, contract, content, sender)
+        self._receipts = {}
+        self._pending_nonces = {}
+        self._started = time.time()
+
+    # --- horloge et minage ---
+    def block_number(self):
+        if self.block_time <= 0:
+            return self._db.execute("SELECT COALESCE(MAX(block), 0) FROM rules").fetchone()[0]
+        return int((time.time() - self._started) / self.block_time)
+
+    def _rpc(self):
+        if self.rpc_latency > 0:
+            time.sleep(self.rpc_latency)
+
+    def _mine(self):
+        """Apply the pending transactions whose block time has come."""
+        now = time.time()
+        with self._lock:
+            ready = [p for p in self._pending if p[0] <= now]
+            if not ready:
+                return
+            self._pending = [p for p in self._pending if p[0] > now]
+            for mine_time, tx_hash, contract, content, sender in ready:
+                # Transaction SQLite : id unique même si plusieurs processus
+                # partagent le même fichier (backend sqlite:)
+                self._db.execute("BEGIN IMMEDIATE")
+                rule_id = self._count(contract)
+                if self.block_time > 0:
+                    block = int((mine_time - self._started) / self.block_time)
+                else:
+                    block = self.block_number() + 1
+                self._db.execute("INSERT INTO rules VALUES (?, ?, ?, ?)",
+                                 (contract, rule_id, content, block))
+                self._db.execute("COMMIT")
+                self._receipts[tx_hash] = AttributeDict(
+                    transactionHash=tx_hash, blockNumber=block, status=1, **{'from': sender},
+                    logs=[AttributeDict(event='RuleAdded', blockNumber=block,
+                                        args=AttributeDict(id=rule_id, content=content))])
+
+    # --- état du contrat ---
+    def _count(self, contract):
+        return self._db.execute("SELECT COUNT(*) FROM rules WHERE contract = ?",
+                                (contract,)).fetchone()[0]
+
+    def rule_count(self, contract):
+        self._rpc()
+        self._mine()
+        with self._lock:
+            return self._count(contract)
+
+    def get_rule(self, contract, rule_id):
+        self._rpc()
+        self._mine()
+        with self._lock:
+            row = self._db.execute("SELECT content FROM rules WHERE contract = ? AND id = ?",
+                                   (contract, rule_id)).fetchone()
+        if row is None:
+            raise ContractLogicError(f"execution reverted: rule {rule_id} does not exist")
+        return row[0]
+
+    def rule_added_events(self, contract, from_block=0):
+        self._rpc()
+        self._mine()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, content, block FROM rules WHERE contract = ? AND block >= ? ORDER BY id",
+                (contract, from_block)).fetchall()
+        return [AttributeDict(event='RuleAdded', blockNumber=block,
+                              args=AttributeDict(id=rule_id, content=content))
+                for rule_id, content, block in rows]
+
+    # --- transactions ---
+    def _nonce(self, account):
+        row = self._db.execute("SELECT nonce FROM nonces WHERE account = ?", (account,)).fetchone()
+        return row[0] if row else 0
+
+    def transaction_count(self, account, block_identifier='latest'):
+        self._rpc()
+        with self._lock:
+            if block_identifier == 'pending':
+                return self._pending_nonces.get(account, self._nonce(account))
+            return self._nonce(account)
+
+    def send_add_rule(self, contract, content, sender, nonce=None):
+        self._rpc()
+        if sender not in self.accounts:
+            raise ValueError(f"sender account not recognized: {sender}")
+        with self._lock:
+            expected = self._pending_nonces.get(sender, self._nonce(sender))
+            if nonce is not None and nonce != expected:
+                raise ValueError(f"invalid nonce for {sender}: got {nonce}, expected {expected}")
+            self._pending_nonces[sender] = expected + 1
+            self._db.execute("INSERT OR REPLACE INTO nonces VALUES (?, ?)", (sender, expected + 1))
+            tx_hash = '0x' + hashlib.sha256(
+                f"{contract}:{sender}:{expected}:{content}".encode('utf-8')).hexdigest()
+            now = time.time()
+            if self.block_time > 0:
+                # Miné au prochain bloc
+                elapsed = now - self._started
+                mine_time = self._started + math.ceil(elapsed / self.block_time + 1e-9) * self.block_time
+            else:
+                mine_time = now
+            self._pending.append((mine_time, tx_hash, contract, content, sender))
+        self._mine()
+        return tx_hash
+
+    def wait_for_receipt(self, tx_hash, timeout=120, poll_latency=0.1):
+        deadline = time.time() + timeout
+        while True:
+            self._rpc()
+            self._mine()
+            with self._lock:
+                receipt = self._receipts.get(tx_hash)
+                pending = [p[0] for p in self._pending if p[1] == tx_hash]
+            if receipt is not None:
+                return receipt
+            if not pending:
+                raise ValueError(f"transaction {tx_hash} not found")
+            if time.time() >= deadline:
+                raise TimeoutError(f"transaction {tx_hash} not mined after {timeout}s")
+            time.sleep(max(0.0, min(poll_latency, pending[0] - time.time())))
+
+
+class _ContractCall:
+    def __init__(self, contract, name, args):
+        self._contract = contract
+        self._name = name
+        self._args = args
+
+    def call(self):
+        chain, address = self._contract.chain, self._contract.address
+        if self._name in ('getRuleCount', 'ruleCount'):
+            return chain.rule_count(address)
+        if self._name == 'getRule':
+            return chain.get_rule(address, self._args[0])
+        if self._name == 'rules':
+            return [self._args[0], chain.get_rule(address, self._args[0])]
+        if self._name == 'owner':
+            return chain.accounts[0]
+        raise ContractLogicError(f"{self._name} is not a view function")
+
+    def transact(self, transaction=None):
+        if self._name != 'addRule':
+            raise ContractLogicError(f"{self._name} cannot be sent as a transaction")
+        transaction = transaction or {}
+        sender = transaction.get('from') or self._contract.eth.default_account
+        return self._contract.chain.send_add_rule(
+            self._contract.address, self._args[0], sender, transaction.get('nonce'))
+
+
+class _ContractFunctions:
+    def __init__(self, contract, abi):
+        self._contract = contract
+        self._names = {item['name'] for item in abi if item.get('type') == 'function'}
+        missing = [name for name in REQUIRED_FUNCTIONS if name not in self._names]
+        if missing:
+            raise ValueError(f"ABI is missing functions required by the simulated chain: {missing}")
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._names:
+            raise AttributeError(f"contract has no function {name!r}")
+        return lambda *args: _ContractCall(self._contract, name, args)
+
+
+class _RuleAddedEvent:
+    def __init__(self, contract):
+        self._contract = contract
+
+    def __call__(self):
+        return self
+
+    def get_logs(self, from_block=0, **kwargs):
+        from_block = kwargs.get('fromBlock', from_block)
+        return self._contract.chain.rule_added_events(self._contract.address, from_block)
+
+
+class _ContractEvents:
+    def __init__(self, contract):
+        self.RuleAdded = _RuleAddedEvent(contract)
+
+
+class SimulatedContract:
+    def __init__(self, eth, address, abi):
+        self.eth = eth
+        self.chain = eth.chain
+        self.address = address
+        self.functions = _ContractFunctions(self, abi)
+        self.events = _ContractEvents(self)
+
+
+class _SimulatedEth:
+    def __init__(self, chain):
+        self.chain = chain
+        self.accounts = list(chain.accounts)
+        self.default_account = None
+
+    @property
+    def block_number(self):
+        return self.chain.block_number()
+
+    def contract(self, address, abi):
+        return SimulatedContract(self, address, abi)
+
+    def get_transaction_count(self, account, block_identifier='latest'):
+        return self.chain.transaction_count(account, block_identifier)
+
+    def wait_for_transaction_receipt(self, tx_hash, timeout=120, poll_latency=0.1):
+        return self.chain.wait_for_receipt(tx_hash, timeout, poll_latency)
+
+
+class SimulatedWeb3:
+    """Stand-in for web3.Web3 backed by a SimulatedChain."""
+
+    def __init__(self, chain):
+        self.eth = _SimulatedEth(chain)
+
+    def is_connected(self):
+        return True
+
+
+# Une chaîne simulée par backend et par processus (partagée entre modules)
+_CHAINS = {}
+_CHAINS_LOCK = threading.Lock()
+
+
+def simulated_chain(backend):
+    with _CHAINS_LOCK:
+        if backend not in _CHAINS:
+            path = backend.split(':', 1)[1] if backend.startswith('sqlite:') else ':memory:'
+            _CHAINS[backend] = SimulatedChain(
+                path,
+                block_time=float(os.environ.get("CHAIN_BLOCK_TIME", "0")),
+                rpc_latency=float(os.environ.get("CHAIN_RPC_LATENCY", "0")),
+            )
+        return _CHAINS[backend]
+
+
+def connect(contract_address, abi, url=None, backend=None):
+    """
+    Return (web3, contract) for the RandomForestRules contract at
+    `contract_address`, on the backend selected by `backend` or the
+    CHAIN_BACKEND environment variable. The first node account becomes
+    the default sender.
+    """
+    backend = backend or os.environ.get("CHAIN_BACKEND", "web3")
+    url = url or os.environ.get("CHAIN_URL", GANACHE_URL)
+
+    if backend == "web3":
+        from web3 import Web3
+        web3 = Web3(Web3.HTTPProvider(url))
+        if not web3.is_connected():
+            raise Exception(f"Cannot connect to Ganache at {url}")
+    elif backend == "memory" or backend.startswith("sqlite:"):
+        web3 = SimulatedWeb3(simulated_chain(backend))
+    else:
+        raise ValueError(f"Unknown CHAIN_BACKEND {backend!r} (web3, memory or sqlite:<path>)")
+
+    accounts = web3.eth.accounts
+    if not accounts:
+        raise Exception("No accounts found on the node; is Ganache running unlocked?")
+    web3.eth.default_account = accounts[0]
+    return web3, web3.eth.contract(address=contract_address, abi=abi)
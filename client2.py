@@ -1,12 +1,22 @@
 
-import pandas as pd
+import os
+
 import requests
-from collections import Counter
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.tree import export_text
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 
+from dataset import load_dataset
+from incremental import retrain
+from profiling import StageProfiler
+from rule_canonical import canonicalizer_from_spec
+from rule_extraction import count_forest_rules, split_rules
+from rule_sync import SyncClient
+from rule_weights import compute_sample_weights
+
+# CLIENT_PROFILE=1 : temps et mémoire par étape (voir profiling.py)
+profiler = StageProfiler.from_env('client2')
+
 # 1) Paramètres
 FEATURE_COLUMNS = [
     'src_bytes', 'dst_bytes', 'rerror_rate', 'dst_host_count',
@@ -16,9 +26,18 @@ FEATURE_COLUMNS = [
 TARGET_COLUMN = 'labels'      # or 'attack'
 TRAIN_PATH    = 'processed-kdd2.csv'
 SERVER_URL    = 'http://0.0.0.0:5000/correct_rules'  # match Flask server
+RETRAIN_MODE  = os.environ.get('RETRAIN_MODE', 'full')  # full, warm_start ou touched
+# Forme canonique des règles : none, exact, precision:N ou quantile:N
+# (la même que celle des règles stockées, voir rule_canonical.py)
+RULE_CANONICAL = os.environ.get('RULE_CANONICAL', 'none')
+# SYNC_PROTOCOL=delta : n'échange que les règles nouvelles depuis le tour
+# précédent (POST /sync_rules, cache local, voir rule_sync.py)
+SYNC_PROTOCOL = os.environ.get('SYNC_PROTOCOL', 'full')
+SYNC_URL      = SERVER_URL.rsplit('/', 1)[0] + '/sync_rules'
 
 # 2) Chargement & split
-df = pd.read_csv(TRAIN_PATH)
+profiler.stage('2) Chargement & split')
+df = load_dataset(TRAIN_PATH, FEATURE_COLUMNS, TARGET_COLUMN)
 X = df[FEATURE_COLUMNS]
 y = df[TARGET_COLUMN]
 X_train, X_test, y_train, y_test = train_test_split(
@@ -26,6 +45,7 @@ X_train, X_test, y_train, y_test = train_test_split(
 )
 
 # 3) Entraînement initial
+profiler.stage('3) Entraînement initial')
 rf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
 rf.fit(X_train, y_train)
 y_pred = rf.predict(X_test)
@@ -33,23 +53,29 @@ acc_before = accuracy_score(y_test, y_pred)
 print(f"Accuracy avant correction : {acc_before:.4f}")
 
 # 4) Extraction des règles incertaines
-all_rules = []
-for tree in rf.estimators_:
-    txt = export_text(tree, feature_names=FEATURE_COLUMNS)
-    for line in txt.split('\n'):
-        l = line.strip()
-        if l:
-            all_rules.append(l)
-
-rule_counts = Counter(all_rules)
-threshold = len(rf.estimators_) * 0.5
-uncertain_rules = [r for r, cnt in rule_counts.items() if cnt < threshold]
+profiler.stage('4) Extraction des règles incertaines')
+# Chaque règle = chemin racine -> noeud (préfixes compris, comme extract_rules.py),
+# au format texte canonique, extraite et comptée en parallèle sur les arbres
+# (même n_jobs que la forêt). Le serveur renvoie les règles stockées qui
+# commencent par une règle incertaine : un chemin complet jusqu'à la feuille
+# n'est presque jamais le début d'une règle stockée
+canonicalizer = canonicalizer_from_spec(RULE_CANONICAL, FEATURE_COLUMNS, X_train)
+rule_counts = count_forest_rules(rf, FEATURE_COLUMNS, canonicalizer=canonicalizer,
+                                 prefixes=True)
+_, uncertain_rules = split_rules(rule_counts, len(rf.estimators_), 0.5)
 print(f"Règles incertaines extraites : {len(uncertain_rules)}")
 
 # 5) Envoi au serveur pour correction (accumulé sur serveur)
-resp = requests.post(SERVER_URL, json={'uncertain_rules': uncertain_rules})
-data = resp.json()
-all_corrected_rules = resp.json().get('all_corrected_rules', [])
+profiler.stage('5) Envoi au serveur pour correction')
+if SYNC_PROTOCOL == 'delta':
+    sync_client = SyncClient(SYNC_URL, cache_path='rule_sync_cache_client2.json')
+    corrected, all_corrected, num_stored = sync_client.sync(uncertain_rules)
+    data = {'corrected_rules': corrected, 'all_corrected_rules': all_corrected,
+            'num_stored': num_stored}
+else:
+    resp = requests.post(SERVER_URL, json={'uncertain_rules': uncertain_rules})
+    data = resp.json()
+all_corrected_rules = data.get('all_corrected_rules', [])
 print(f"Règles corrigées globales reçues du serveur : {len(all_corrected_rules)}")
 
 # Récupérer et afficher le nombre total de règles stockées sur le serveur
@@ -59,26 +85,25 @@ print(f"Nombre total de règles stockées sur le serveur : {total_stored}")
 
 
 # 6) Création de poids d’échantillons basés sur les règles corrigées
-weights = [1.0] * len(y_train)
-for idx, row in X_train.iterrows():
-    for rule in all_corrected_rules:
-        cond = rule.split(" then")[0].replace("if ", "")
-        try:
-            if eval(cond, {}, row.to_dict()):
-                weights[idx] *= 1.5
-        except Exception:
-            pass
+profiler.stage('6) Poids d’échantillons')
+weights = compute_sample_weights(X_train, all_corrected_rules, factor=1.5)
 
 # 7) Ré-entraînement avec les poids & évaluation
-rf2 = RandomForestClassifier(
+profiler.stage('7) Ré-entraînement avec les poids & évaluation')
+# RETRAIN_MODE=warm_start|touched réutilise rf au lieu d'un refit complet
+# (voir incremental.py)
+rf2 = retrain(
+    rf, X_train, y_train, weights, all_corrected_rules, mode=RETRAIN_MODE,
+    feature_names=FEATURE_COLUMNS, canonicalizer=canonicalizer,
     n_estimators=200,
     max_depth=10,
     class_weight='balanced',
     random_state=42,
     n_jobs=-1
 )
-rf2.fit(X_train, y_train, sample_weight=weights)
 y_pred2 = rf2.predict(X_test)
 acc_after = accuracy_score(y_test, y_pred2)
 print(f"Accuracy après correction : {acc_after:.4f}")
 print(f"Amélioration : {acc_after - acc_before:+.4f}")
+
+profiler.finish()
@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
-import pandas as pd
+import os
+
 import numpy as np
 import requests
-from collections import Counter
 
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.tree import export_text
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import LabelEncoder
 
+from dataset import load_dataset
+from incremental import retrain
+from profiling import StageProfiler
+from rule_canonical import canonicalizer_from_spec
+from rule_extraction import count_forest_rules, split_rules
+from rule_sync import SyncClient
+from rule_weights import compute_sample_weights
+
 def manual_label_flip(y, flip_frac=0.1, random_state=42):
     """
     Return a copy of y where `flip_frac` fraction of labels have been flipped.
@@ -32,6 +39,9 @@ def manual_label_flip(y, flip_frac=0.1, random_state=42):
     return y_flipped, idx
 
 def main():
+    # CLIENT_PROFILE=1 : temps et mémoire par étape (voir profiling.py)
+    profiler = StageProfiler.from_env('client_poinsion_secml')
+
     # 1) Params
     FEATURES = [
         'src_bytes','dst_bytes','rerror_rate','dst_host_count',
@@ -41,9 +51,13 @@ def main():
     TARGET   = 'labels'
     TRAIN_FP = 'processed_nsl_kdd_normal_malicious.csv'
     SERVER   = 'http://localhost:5000/correct_rules'
+    RETRAIN_MODE = os.environ.get('RETRAIN_MODE', 'full')  # full, warm_start or touched
+    RULE_CANONICAL = os.environ.get('RULE_CANONICAL', 'none')  # see rule_canonical.py
+    SYNC_PROTOCOL = os.environ.get('SYNC_PROTOCOL', 'full')  # full or delta (rule_sync.py)
 
     # 2) Load & split
-    df = pd.read_csv(TRAIN_FP)
+    profiler.stage('2) Load & split')
+    df = load_dataset(TRAIN_FP, FEATURES, TARGET)
     X = df[FEATURES]
     y = df[TARGET]
     X_train, X_test, y_train, y_test = train_test_split(
@@ -51,11 +65,13 @@ def main():
     )
 
     # 3) Encode labels
+    profiler.stage('3) Encode labels')
     le = LabelEncoder()
     y_train_enc = le.fit_transform(y_train)
     y_test_enc  = le.transform(y_test)
 
     # 4) Train clean RF
+    profiler.stage('4) Train clean RF')
     rf_clean = RandomForestClassifier(
         n_estimators=100, random_state=42, n_jobs=-1
     )
@@ -64,6 +80,7 @@ def main():
     print(f"▶ Accuracy clean: {acc_clean:.4f}")
 
     # 5) Manual poisoning: flip 10% of labels
+    profiler.stage('5) Manual poisoning: flip 10% of labels')
     flip_frac = 0.1
     y_train_p, flipped_idx = manual_label_flip(
         y_train_enc, flip_frac=flip_frac, random_state=42
@@ -71,6 +88,7 @@ def main():
     print(f"▶ Manual poisoning: flipped {len(flipped_idx)} labels ({flip_frac*100:.0f}%)")
 
     # 6) Train poisoned RF
+    profiler.stage('6) Train poisoned RF')
     rf_p = RandomForestClassifier(
         n_estimators=100, random_state=42, n_jobs=-1
     )
@@ -79,40 +97,43 @@ def main():
     print(f"▶ Accuracy poisoned: {acc_pois:.4f}  (drop {acc_pois - acc_clean:+.4f})")
 
     # 7) Extract “uncertain” rules
-    all_rules = []
-    for tree in rf_p.estimators_:
-        txt = export_text(tree, feature_names=FEATURES)
-        for line in txt.splitlines():
-            if line.strip():
-                all_rules.append(line.strip())
-    threshold = len(rf_p.estimators_) * 0.5
-    uncertain = [r for r,c in Counter(all_rules).items() if c < threshold]
+    profiler.stage('7) Extract “uncertain” rules')
+    # Préfixes compris : le serveur renvoie les règles stockées qui commencent
+    # par une règle incertaine (voir client1.py)
+    canonicalizer = canonicalizer_from_spec(RULE_CANONICAL, FEATURES, X_train)
+    rule_counts = count_forest_rules(rf_p, FEATURES, canonicalizer=canonicalizer,
+                                     prefixes=True)
+    _, uncertain = split_rules(rule_counts, len(rf_p.estimators_), 0.5)
     print(f"▶ Uncertain rules: {len(uncertain)}")
 
     # 8) Send to server & get corrections
-    resp = requests.post(SERVER, json={'uncertain_rules': uncertain})
-    corrected = resp.json().get('corrected_rules', [])
+    profiler.stage('8) Send to server & get corrections')
+    if SYNC_PROTOCOL == 'delta':
+        sync_client = SyncClient(SERVER.rsplit('/', 1)[0] + '/sync_rules',
+                                 cache_path='rule_sync_cache_client_poinsion_secml.json')
+        corrected, _, _ = sync_client.sync(uncertain)
+    else:
+        resp = requests.post(SERVER, json={'uncertain_rules': uncertain})
+        corrected = resp.json().get('corrected_rules', [])
     print(f"▶ Corrected rules: {len(corrected)}")
 
     # 9) Re-weight samples for retraining
-    weights = np.ones(len(y_train_p), dtype=float)
-    for i, row in X_train.reset_index(drop=True).iterrows():
-        for rule in corrected:
-            cond = rule.split(" then")[0].replace("if ", "")
-            try:
-                if eval(cond, {}, row.to_dict()):
-                    weights[i] *= 2.0
-            except Exception:
-                pass
+    profiler.stage('9) Re-weight samples for retraining')
+    weights = compute_sample_weights(X_train, corrected, factor=2.0)
 
     # 10) Retrain & evaluate final RF
-    rf_final = RandomForestClassifier(
+    profiler.stage('10) Retrain & evaluate final RF')
+    # RETRAIN_MODE=warm_start|touched réutilise rf_p (voir incremental.py)
+    rf_final = retrain(
+        rf_p, X_train, y_train_p, weights, corrected, mode=RETRAIN_MODE,
+        feature_names=FEATURES, canonicalizer=canonicalizer,
         n_estimators=200, max_depth=10,
         class_weight='balanced', random_state=42, n_jobs=-1
     )
-    rf_final.fit(X_train, y_train_p, sample_weight=weights)
     acc_final = accuracy_score(y_test_enc, rf_final.predict(X_test))
     print(f"▶ Accuracy after correction: {acc_final:.4f}  (gain {acc_final - acc_pois:+.4f})")
 
+    profiler.finish()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,107 @@
+"""
+Append-only, deduplicated store of the corrected rules sent to clients.
+
+Rules are kept in memory as a list (in insertion order) plus a set of the
+same string objects for O(1) dedup, and persisted in a plain append-only
+log, one rule per line, replayed at startup.
+
+Appends of all processes go through the log: a writer takes an exclusive
+flock on it, first replays what other processes (gunicorn workers)
+appended since its last read, then appends its own new rules with a
+single write. Dedup is therefore global, and each process sees the rules
+of the others at its next append or refresh(). Readers take no lock: the
+list only ever grows and `count` is updated after the list, so
+rules()[:count] is always a consistent prefix.
+"""
+import fcntl
+import os
+import threading
+
+
+class CorrectedRuleStore:
+
+    def __init__(self, path):
+        self.path = path
+        self._rules = []
+        self._seen = set()
+        self._offset = 0          # octets du log déjà rejoués
+        self._lock = threading.Lock()
+        self.count = 0
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._catch_up(fd, repair=True)
+            finally:
+                os.close(fd)
+
+    def __len__(self):
+        return self.count
+
+    def rules(self, count=None, start=0):
+        """Stored rules start..count (default: all), in insertion order."""
+        if count is None:
+            count = self.count
+        return self._rules[start:count]
+
+    def _catch_up(self, fd, repair=False):
+        """Replay the log from self._offset. Call with self._lock and the flock held."""
+        size = os.fstat(fd).st_size
+        if size <= self._offset:
+            return
+        data = os.pread(fd, size - self._offset, self._offset)
+        end = data.rfind(b'\n') + 1
+        if end < len(data) and repair:
+            # Ligne incomplète (écriture interrompue) : on la coupe
+            os.ftruncate(fd, self._offset + end)
+        for line in data[:end].decode('utf-8').split('\n')[:-1]:
+            if line and line not in self._seen:
+                self._seen.add(line)
+                self._rules.append(line)
+        self._offset += end
+        self.count = len(self._rules)
+
+    def refresh(self):
+        """Load the rules other processes appended since the last read."""
+        try:
+            if os.stat(self.path).st_size == self._offset:
+                return self.count
+        except FileNotFoundError:
+            return self.count
+        with self._lock:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                self._catch_up(fd)
+            finally:
+                os.close(fd)
+        return self.count
+
+    def add(self, rules):
+        """
+        Append the rules not stored yet (one line each; rules containing
+        line breaks are ignored). Returns the number of stored rules.
+        """
+        candidates = [r for r in dict.fromkeys(rules)
+                      if r and r not in self._seen and '\n' not in r and '\r' not in r]
+        if not candidates:
+            # Rien de neuf localement : juste rattraper les autres processus
+            return self.refresh()
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._catch_up(fd, repair=True)
+                new = [r for r in candidates if r not in self._seen]
+                if new:
+                    data = ''.join(r + '\n' for r in new).encode('utf-8')
+                    written = 0
+                    while written < len(data):
+                        written += os.write(fd, data[written:])
+                    self._seen.update(new)
+                    self._rules.extend(new)
+                    self._offset += len(data)
+                    self.count = len(self._rules)
+            finally:
+                os.close(fd)
+        return self.count
@@ -0,0 +1,155 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = [
+    'src_bytes', 'dst_bytes', 'rerror_rate', 'dst_host_count',
+    'dst_host_srv_count', 'dst_host_same_srv_rate',
+    'dst_host_diff_srv_rate', 'dst_host_srv_diff_host_rate'
+]
+TARGET_COLUMN = 'labels'
+
+# Les caches vont dans un répertoire dédié, pas à côté des CSV (les captures
+# non étiquetées peuvent peser plusieurs Go)
+CACHE_DIR = os.environ.get("DATASET_CACHE_DIR", "dataset_cache")
+# Version 2 : une colonne n'est en float32 que si la conversion est exacte
+CACHE_FORMAT = 2
+
+
+def cache_path(csv_path, columns, target, cache_dir=CACHE_DIR):
+    """Cache file in `cache_dir`, one per CSV and selection of columns."""
+    key = hashlib.sha1(repr((CACHE_FORMAT, os.path.abspath(csv_path), list(columns), target))
+                       .encode('utf-8')).hexdigest()[:10]
+    return os.path.join(cache_dir, f"{os.path.basename(csv_path)}.{key}.npz")
+
+
+def _csv_stamp(csv_path):
+    st = os.stat(csv_path)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def _read_cache(path, stamp, columns, target):
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            if not np.array_equal(npz['__stamp__'], stamp):
+                return None
+            data = {col: npz[col] for col in columns}
+            if target is not None:
+                data[target] = pd.Categorical.from_codes(
+                    npz['__codes__'], categories=npz['__categories__'])
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return None
+    return pd.DataFrame(data)
+
+
+def _write_cache(path, stamp, df, columns, target):
+    arrays = {col: df[col].to_numpy() for col in columns}
+    if target is not None:
+        labels = df[target].cat
+        arrays['__codes__'] = labels.codes.to_numpy()
+        categories = labels.categories.to_numpy()
+        # Les étiquettes numériques gardent leur type ; le texte sans pickle
+        arrays['__categories__'] = categories.astype(str) if categories.dtype == object \
+            else categories
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, __stamp__=stamp, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_dataset(csv_path, columns=FEATURE_COLUMNS, target=TARGET_COLUMN,
+                 use_cache=True):
+    """
+    Load only `columns` and the `target` label column (as a pandas
+    Categorical of its natural dtype, so 0/1 labels stay integers) from
+    an NSL-KDD style CSV. Pass target=None for unlabeled files.
+
+    A feature column is stored as float32 only when every value converts
+    exactly (counts below 2**24); the others, such as the two-decimal
+    rates, stay float64. The values are then those of pd.read_csv, so the
+    clients' rule weights match the original eval() over the CSV: a rate
+    of 0.07 as float32 reads back as 0.0700000003 and would fail the rule
+    "rerror_rate <= 0.07".
+
+    With `use_cache`, the result is cached in a columnar .npz file under
+    DATASET_CACHE_DIR and reused as long as the CSV keeps the same size
+    and mtime, so repeat runs skip CSV parsing entirely.
+    """
+    columns = list(columns)
+    stamp = _csv_stamp(csv_path)
+    path = cache_path(csv_path, columns, target)
+    if use_cache:
+        df = _read_cache(path, stamp, columns, target)
+        if df is not None:
+            return df
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    if target is not None and target not in header:
+        raise ValueError(f"Missing '{target}' column in {csv_path}")
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise ValueError(f"{csv_path} is missing columns: {missing}")
+
+    dtypes = {col: np.float64 for col in columns}
+    usecols = columns if target is None else columns + [target]
+    df = pd.read_csv(csv_path, usecols=usecols, dtype=dtypes)[usecols]
+    for col in columns:
+        values = df[col].to_numpy()
+        narrow = values.astype(np.float32)
+        if np.array_equal(narrow, values, equal_nan=True):
+            df[col] = narrow
+    if target is not None:
+        df[target] = df[target].astype('category')
+
+    if use_cache:
+        try:
+            _write_cache(path, stamp, df, columns, target)
+        except OSError as e:
+            print(f"Warning: could not write dataset cache {path}: {e}")
+    return df
+
+
+def make_synthetic(n_rows, seed=0, attack_ratio=0.45):
+    """
+    Synthetic NSL-KDD shaped dataset: the eight FEATURE_COLUMNS with
+    realistic ranges (heavy-tailed byte counts, 0-255 host counts, rates
+    in [0, 1]) and a 'normal' / 'malicious' label that depends on them,
+    with some label noise. Used by the benchmarks and load harnesses.
+    """
+    rng = np.random.default_rng(seed)
+    attack = rng.random(n_rows) < attack_ratio
+    n_attack = attack.sum()
+
+    def mix(normal, malicious):
+        out = np.empty(n_rows, dtype=np.float64)
+        out[~attack] = normal(n_rows - n_attack)
+        out[attack] = malicious(n_attack)
+        return out
+
+    df = pd.DataFrame({
+        'src_bytes': mix(lambda n: np.round(rng.lognormal(6.0, 1.5, n)),
+                         lambda n: np.round(rng.lognormal(2.0, 2.5, n))),
+        'dst_bytes': mix(lambda n: np.round(rng.lognormal(7.0, 2.0, n)),
+                         lambda n: np.round(rng.lognormal(0.5, 1.5, n))),
+        'rerror_rate': mix(lambda n: rng.beta(0.3, 8.0, n),
+                           lambda n: rng.beta(1.5, 2.0, n)),
+        'dst_host_count': mix(lambda n: rng.integers(0, 256, n),
+                              lambda n: np.minimum(255, rng.poisson(200, n))),
+        'dst_host_srv_count': mix(lambda n: np.minimum(255, rng.poisson(180, n)),
+                                  lambda n: rng.integers(0, 60, n)),
+        'dst_host_same_srv_rate': mix(lambda n: rng.beta(8.0, 1.0, n),
+                                      lambda n: rng.beta(1.0, 5.0, n)),
+        'dst_host_diff_srv_rate': mix(lambda n: rng.beta(1.0, 20.0, n),
+                                      lambda n: rng.beta(1.0, 6.0, n)),
+        'dst_host_srv_diff_host_rate': mix(lambda n: rng.beta(1.0, 15.0, n),
+                                           lambda n: rng.beta(1.0, 10.0, n)),
+    })[FEATURE_COLUMNS].astype(np.float32)
+
+    # Bruit d'étiquetage : le problème n'est pas parfaitement séparable
+    noisy = rng.random(n_rows) < 0.03
+    labels = np.where(attack ^ noisy, 'malicious', 'normal')
+    df[TARGET_COLUMN] = pd.Categorical(labels, categories=['malicious', 'normal'])
+    return df
@@ -1,9 +1,13 @@
-import pandas as pd
-from collections import Counter
+import os
+
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.tree import export_text
 from sklearn.model_selection import train_test_split
 
+from dataset import load_dataset
+from rule_canonical import canonicalizer_from_spec
+from rule_extraction import count_forest_rules, split_rules
+from rule_fastpath import purity_path, rule_purity, save_purity
+
 # 1) Paramètres
 FEATURE_COLUMNS = [
     'src_bytes', 'dst_bytes', 'rerror_rate', 'dst_host_count',
@@ -13,9 +17,20 @@ FEATURE_COLUMNS = [
 TARGET_COLUMN = 'labels'
 TRAIN_PATH = 'processed-kdd2.csv'  # Remplacez par le chemin de votre CSV
 OUTPUT_RULES_FILE = 'certain_rules.txt'
+# Forme canonique des règles : none, exact, precision:N ou quantile:N
+# (doit être la même que celle des clients, voir rule_canonical.py)
+RULE_CANONICAL = os.environ.get('RULE_CANONICAL', 'none')
+# Une règle "certaine" est un chemin racine -> noeud (n'importe quel noeud sous
+# la racine, étiqueté par la classe majoritaire du noeud) présent dans plus de
+# CERTAIN_RULE_RATIO des arbres. Le critère d'origine (>50% des arbres) reste
+# le défaut ; avec le tirage des features à chaque split, peu de chemins le
+# dépassent et le fichier peut être vide : baisser alors le ratio explicitement
+# (par ex. CERTAIN_RULE_RATIO=0.1), en sachant qu'il retient surtout des
+# splits d'un ou deux niveaux
+CERTAIN_RULE_RATIO = float(os.environ.get('CERTAIN_RULE_RATIO', '0.5'))
 
 # 2) Charger les données
-df = pd.read_csv(TRAIN_PATH)
+df = load_dataset(TRAIN_PATH, FEATURE_COLUMNS, TARGET_COLUMN)
 X = df[FEATURE_COLUMNS]
 y = df[TARGET_COLUMN]
 
@@ -30,32 +45,31 @@ rf.fit(X_train, y_train)
 
 # 5) Extraire les règles de chaque arbre au format texte
 n_trees = len(rf.estimators_)
-rule_tree_count = Counter()
 
-for tree in rf.estimators_:
-    # export_text renvoie une chaîne où chaque ligne correspond à un noeud/règle
-    txt = export_text(tree, feature_names=FEATURE_COLUMNS)
-    # On récupère chaque ligne non vide (strip pour enlever indentation ASCII-art)
-    lines = [line.strip() for line in txt.splitlines() if line.strip()]
-    # Pour que chaque règle ne soit comptée qu'une fois par arbre, on prend l'ensemble
-    unique_lines = set(lines)
-    for rule in unique_lines:
-        rule_tree_count[rule] += 1
+# Chaque règle = chemin racine -> noeud (préfixes compris), lu directement dans
+# tree_ : comme les lignes par noeud d'export_text, les premiers niveaux se
+# retrouvent d'un arbre à l'autre, alors qu'un chemin complet jusqu'à la
+# feuille n'apparaît presque jamais dans plus de 50% des arbres.
+# Extraction répartie sur n_jobs processus ; chaque règle n'est comptée
+# qu'une fois par arbre (nombre d'arbres qui la contiennent)
+canonicalizer = canonicalizer_from_spec(RULE_CANONICAL, FEATURE_COLUMNS, X_train)
+rule_tree_count = count_forest_rules(rf, FEATURE_COLUMNS, per_tree_unique=True,
+                                     canonicalizer=canonicalizer, prefixes=True)
 
 # 5.a) Afficher le nombre total de règles uniques extraites
 total_unique_rules = len(rule_tree_count)
 print(f"Nombre total de règles uniques extraites des {n_trees} arbres : {total_unique_rules}")
 
-# 6) Sélectionner les "certain rules" : celles présentes dans > 50% des arbres
-threshold = n_trees * 0.5
-certain_rules = [
-    rule for rule, count in rule_tree_count.items()
-    if count > threshold
-]
+# 6) Sélectionner les "certain rules" : celles présentes dans > CERTAIN_RULE_RATIO des arbres
+certain_rules, _ = split_rules(rule_tree_count, n_trees, CERTAIN_RULE_RATIO)
 
 # 6.a) Afficher le nombre de "certain rules"
 num_certain = len(certain_rules)
-print(f"Nombre de règles ‘certaines’ (apparaissent dans >50% des arbres) : {num_certain}")
+print(f"Nombre de règles ‘certaines’ (apparaissent dans >{CERTAIN_RULE_RATIO:.0%} des arbres) : "
+      f"{num_certain}")
+if not certain_rules:
+    print(f"Aucune règle présente dans plus de {CERTAIN_RULE_RATIO:.0%} des arbres : "
+          f"relancez avec un CERTAIN_RULE_RATIO plus bas (par ex. 0.1) si besoin")
 
 # 7) Sauvegarder ces règles dans un fichier texte
 with open(OUTPUT_RULES_FILE, 'w') as f:
@@ -63,3 +77,9 @@ with open(OUTPUT_RULES_FILE, 'w') as f:
         f.write(rule + '\n')
 
 print(f"{num_certain} règles sauvegardées dans '{OUTPUT_RULES_FILE}'.")
+
+# 8) Pureté de chaque règle sur l'entraînement : "certaine" ne dit que la part
+# des arbres qui la contiennent ; rule_fastpath.py ne répond qu'avec les
+# règles assez pures
+save_purity(rule_purity(X_train, y_train, certain_rules), OUTPUT_RULES_FILE)
+print(f"Pureté des règles sauvegardée dans '{purity_path(OUTPUT_RULES_FILE)}'.")
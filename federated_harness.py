@@ -0,0 +1,308 @@
+"""
+Multi-client federated load harness.
+
+Runs N simulated clients in parallel processes against one server. Each
+client takes a shard of a dataset (or its own synthetic dataset) and runs
+rounds of the client1.py / client2.py cycle: extract uncertain rules ->
+POST to the server -> reweight samples -> retrain. For each N the harness
+reports aggregate round throughput, server latency percentiles as seen by
+the clients, and client CPU use.
+
+    python federated_harness.py --start-server --clients 1 2 4 8 --rounds 3
+    python federated_harness.py --url http://127.0.0.1:5000 --data kdd.csv --clients 4 16
+
+--start-server runs offline: the rules of a peer forest trained on
+synthetic data are anchored on a simulated SQLite chain (one transaction,
+see merkle_anchor.py), then server.py is started on it (gunicorn with
+--workers > 1).
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import requests
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from dataset import FEATURE_COLUMNS, TARGET_COLUMN, load_dataset, make_synthetic
+from incremental import retrain
+from rule_canonical import canonicalizer_from_spec
+from rule_extraction import count_forest_rules, split_rules
+from rule_sync import SyncClient
+from rule_weights import compute_sample_weights
+
+
+def client_shard(client_id, n_clients, data_path, rows, seed):
+    """Rows of one client: every n_clients-th row of data_path, or a synthetic dataset."""
+    if data_path:
+        df = load_dataset(data_path, FEATURE_COLUMNS, TARGET_COLUMN)
+        return df.iloc[client_id::n_clients].reset_index(drop=True)
+    return make_synthetic(rows, seed=seed + client_id)
+
+
+def run_client(client_id, n_clients, config):
+    """One client process: `rounds` federated rounds. Returns its round records."""
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    df = client_shard(client_id, n_clients, config['data'], config['rows'], config['seed'])
+    X, y = df[FEATURE_COLUMNS], df[TARGET_COLUMN]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.3, random_state=config['seed'])
+
+    # Un seul cœur par client : le parallélisme vient des processus
+    rf = RandomForestClassifier(n_estimators=config['trees'], random_state=client_id, n_jobs=1)
+    rf.fit(X_train, y_train)
+    canonicalizer = canonicalizer_from_spec(config['canonical'], FEATURE_COLUMNS, X_train)
+    session = requests.Session()
+    sync_client = None
+    if config['protocol'] == 'delta':
+        sync_client = SyncClient(config['url'] + '/sync_rules', cache_path=None, session=session)
+
+    rounds = []
+    for r in range(config['rounds']):
+        started_at = time.time()
+        t0 = time.perf_counter()
+        counts = count_forest_rules(rf, FEATURE_COLUMNS, n_jobs=1, canonicalizer=canonicalizer,
+                                    prefixes=True)
+        _, uncertain = split_rules(counts, len(rf.estimators_), 0.5)
+        t1 = time.perf_counter()
+        if sync_client is not None:
+            _, all_corrected, num_stored = sync_client.sync(uncertain)
+        else:
+            resp = session.post(config['url'] + '/correct_rules', json={'uncertain_rules': uncertain})
+            resp.raise_for_status()
+            data = resp.json()
+            all_corrected, num_stored = data.get('all_corrected_rules', []), data.get('num_stored', 0)
+        t2 = time.perf_counter()
+        weights = compute_sample_weights(X_train, all_corrected, factor=1.5)
+        t3 = time.perf_counter()
+        n_estimators = config['retrain_trees']
+        if config['retrain'] == 'warm_start':
+            # warm_start ne fait pousser que les arbres au-delà de la taille actuelle :
+            # chaque round en ajoute autant que le premier
+            n_estimators = len(rf.estimators_) + max(1, config['retrain_trees'] - config['trees'])
+        rf = retrain(rf, X_train, y_train, weights, all_corrected, mode=config['retrain'],
+                     canonicalizer=canonicalizer,
+                     n_estimators=n_estimators, max_depth=10,
+                     class_weight='balanced', random_state=42, n_jobs=1)
+        t4 = time.perf_counter()
+        rounds.append({
+            'client': client_id, 'round': r,
+            'uncertain_rules': len(uncertain), 'corrected_rules': len(all_corrected),
+            'num_stored': num_stored,
+            'extract_seconds': t1 - t0, 'server_seconds': t2 - t1,
+            'weight_seconds': t3 - t2, 'retrain_seconds': t4 - t3,
+            'round_seconds': t4 - t0, 'n_estimators': len(rf.estimators_),
+            'started_at': started_at, 'ended_at': started_at + (t4 - t0),
+            'accuracy': accuracy_score(y_test, rf.predict(X_test)),
+        })
+
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    return rounds, cpu
+
+
+def server_latency(url):
+    """(count, sum) of the server's own /correct_rules and /sync_rules latency, if exposed."""
+    try:
+        text = requests.get(url + '/metrics', timeout=5).text
+    except requests.RequestException:
+        return None
+    count = total = 0.0
+    for line in text.splitlines():
+        if not line.startswith('http_request_duration_seconds_'):
+            continue
+        if 'route="/correct_rules"' not in line and 'route="/sync_rules"' not in line:
+            continue
+        name, value = line.rsplit(' ', 1)
+        if name.startswith('http_request_duration_seconds_count'):
+            count += float(value)
+        elif name.startswith('http_request_duration_seconds_sum'):
+            total += float(value)
+    return count, total
+
+
+def run_level(n_clients, config):
+    before = server_latency(config['url'])
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_clients) as pool:
+        futures = [pool.submit(run_client, i, n_clients, config) for i in range(n_clients)]
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - start
+    after = server_latency(config['url'])
+
+    rounds = [r for client_rounds, _ in results for r in client_rounds]
+    cpu = sum(c for _, c in results)
+    # Débit mesuré sur la fenêtre des rounds (sans démarrage ni entraînement initial)
+    span = max(r['ended_at'] for r in rounds) - min(r['started_at'] for r in rounds)
+    server = np.array([r['server_seconds'] for r in rounds])
+    level = {
+        'clients': n_clients,
+        'rounds': len(rounds),
+        'wall_seconds': wall,
+        'rounds_span_seconds': span,
+        'rounds_per_second': len(rounds) / span,
+        'round_seconds_mean': float(np.mean([r['round_seconds'] for r in rounds])),
+        'server_latency_p50': float(np.percentile(server, 50)),
+        'server_latency_p95': float(np.percentile(server, 95)),
+        'server_latency_p99': float(np.percentile(server, 99)),
+        'client_cpu_seconds': cpu,
+        # Cœurs occupés en moyenne par les clients (démarrage compris)
+        'client_cpu_cores': cpu / wall,
+        'stage_seconds_mean': {
+            stage: float(np.mean([r[f'{stage}_seconds'] for r in rounds]))
+            for stage in ('extract', 'server', 'weight', 'retrain')
+        },
+        'accuracy_mean': float(np.mean([r['accuracy'] for r in rounds])),
+        'corrected_rules_max': max(r['corrected_rules'] for r in rounds),
+        'round_records': rounds,
+    }
+    if before and after and after[0] > before[0]:
+        level['server_side_latency_mean'] = (after[1] - before[1]) / (after[0] - before[0])
+    return level
+
+
+def seed_chain(chain_env, run_dir, rows, trees, canonical, seed):
+    """
+    Anchor the rules of a peer forest on the simulated chain of `chain_env`.
+    uploadrules.py runs in a child process with `chain_env` and `run_dir`
+    as working directory, so this process's environment is left unchanged
+    and its hash cache is written to `run_dir`.
+    """
+    df = make_synthetic(rows, seed=seed + 1000)
+    peer = RandomForestClassifier(n_estimators=trees, random_state=seed, n_jobs=-1)
+    peer.fit(df[FEATURE_COLUMNS], df[TARGET_COLUMN])
+    canonicalizer = canonicalizer_from_spec(canonical, FEATURE_COLUMNS, df[FEATURE_COLUMNS])
+    rules = list(count_forest_rules(peer, FEATURE_COLUMNS, per_tree_unique=True,
+                                    canonicalizer=canonicalizer))
+    rules_path = os.path.join(run_dir, 'peer_rules.txt')
+    with open(rules_path, 'w') as f:
+        f.write('\n'.join(rules) + '\n')
+    here = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run([sys.executable, os.path.join(here, 'uploadrules.py'), rules_path,
+                    '--anchor', '--blob-dir', chain_env['RULE_BLOB_DIR']],
+                   cwd=run_dir, env=dict(os.environ, **chain_env), check=True,
+                   stdout=subprocess.DEVNULL)
+    return len(rules)
+
+
+def start_server(port, workers, env_overrides, run_dir):
+    """
+    Start server.py (or gunicorn) with `env_overrides`, its local files
+    (snapshot, caches) going to `run_dir`; returns (process, url).
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, **env_overrides)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [here, env.get('PYTHONPATH')]))
+    if workers > 1:
+        env['WEB_CONCURRENCY'] = str(workers)
+        env['BIND'] = f"127.0.0.1:{port}"
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(here, 'gunicorn_conf.py'),
+               'server:app']
+    else:
+        cmd = [sys.executable, '-c',
+               f"import server; server.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    proc = subprocess.Popen(cmd, cwd=run_dir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            requests.get(url + '/metrics', timeout=1)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("server did not start within 120s")
+
+
+def print_report(levels):
+    print(f"\n{'clients':>7} {'rounds/s':>9} {'round (s)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'CPU (cœurs)':>12} {'accuracy':>9}")
+    for lv in levels:
+        print(f"{lv['clients']:>7} {lv['rounds_per_second']:9.3f} {lv['round_seconds_mean']:10.2f} "
+              f"{lv['server_latency_p50'] * 1000:9.1f} {lv['server_latency_p95'] * 1000:9.1f} "
+              f"{lv['server_latency_p99'] * 1000:9.1f} {lv['client_cpu_cores']:12.2f} "
+              f"{lv['accuracy_mean']:9.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Federated multi-client load harness")
+    parser.add_argument("--url", default="http://127.0.0.1:5000",
+                        help="server base URL (ignored with --start-server)")
+    parser.add_argument("--start-server", action="store_true",
+                        help="start server.py on a simulated chain for the run")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="gunicorn workers with --start-server (1 = Flask dev server)")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--data", help="CSV sharded between the clients (default: synthetic)")
+    parser.add_argument("--rows", type=int, default=20_000, help="synthetic rows per client")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--retrain-trees", type=int, default=200)
+    parser.add_argument("--retrain", default="full", choices=['full', 'warm_start', 'touched'],
+                        help="warm_start adds retrain-trees - trees trees to the forest each round")
+    parser.add_argument("--protocol", default="full", choices=['full', 'delta'])
+    parser.add_argument("--canonical", default="none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="federated_results.json")
+    args = parser.parse_args()
+
+    server_proc = None
+    url = args.url.rstrip('/')
+    if args.start_server:
+        run_dir = os.path.abspath(f"federated_run_{int(time.time())}")
+        os.makedirs(run_dir)
+        chain_env = {
+            'CHAIN_BACKEND': f"sqlite:{os.path.join(run_dir, 'chain.db')}",
+            'RULES_CONTRACT_ADDRESS': '0xFederatedHarness',
+            'RULE_BLOB_DIR': os.path.join(run_dir, 'rule_blobs'),
+        }
+        n_rules = seed_chain(chain_env, run_dir, args.rows, args.trees, args.canonical, args.seed)
+        print(f"{n_rules} règles d'une forêt pair ancrées sur la chaîne simulée")
+        server_proc, url = start_server(args.port, args.workers, dict(
+            chain_env,
+            CORRECTED_RULES_LOG=os.path.join(run_dir, 'corrected_rules.log'),
+            RULE_INDEX_FILE=os.path.join(run_dir, 'rule_index.bin'),
+        ), run_dir)
+        print(f"Serveur démarré sur {url} ({args.workers} worker(s))")
+
+    config = {
+        'url': url, 'data': args.data, 'rows': args.rows, 'seed': args.seed,
+        'rounds': args.rounds, 'trees': args.trees, 'retrain_trees': args.retrain_trees,
+        'retrain': args.retrain, 'protocol': args.protocol, 'canonical': args.canonical,
+    }
+    levels = []
+    try:
+        for n in args.clients:
+            print(f"[*] {n} client(s), {args.rounds} round(s) chacun...")
+            levels.append(run_level(n, config))
+    finally:
+        if server_proc is not None:
+            server_proc.terminate()
+            server_proc.wait()
+
+    print_report(levels)
+    report = {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'python': platform.python_version(), 'cpus': os.cpu_count(),
+                 'args': vars(args)},
+        'levels': levels,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRésultats écrits dans {args.output}")
+    # Sans aucune règle corrigée, pondération, stockage et resynchronisation
+    # n'ont rien fait : le run ne mesure pas le cycle de correction
+    if levels and not any(lv['corrected_rules_max'] for lv in levels):
+        sys.exit("Erreur : aucune règle corrigée reçue du serveur sur l'ensemble des rounds")
@@ -0,0 +1,214 @@
+"""
+Flat-array RandomForest evaluator for single-row and small-batch prediction.
+
+A fitted RandomForestClassifier (e.g. corrected_rf_model.pkl) is exported
+to contiguous NumPy node arrays shared by all its trees, and all trees are
+walked at once with vectorized NumPy operations. Predictions are
+bit-identical to model.predict: same float32 cast of X, same float64
+thresholds, same per-tree normalization and tree-order accumulation of
+the class probabilities.
+
+    python flat_forest.py export corrected_rf_model.pkl flat_forest.npz
+    python flat_forest.py bench corrected_rf_model.pkl --data kdd_processed.csv
+"""
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+from sklearn.tree import _tree
+
+from dataset import FEATURE_COLUMNS, load_dataset
+
+
+class FlatForest:
+    """
+    All trees of a forest stored in flat arrays indexed by a global node id.
+
+    Leaves point to themselves, so walking `max_depth` steps from the
+    roots lands every (row, tree) pair on its leaf without masking.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, proba,
+                 roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.proba = proba
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, lefts, rights, missing, probas, roots = ([] for _ in range(7))
+        offset = 0
+        max_depth = 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == _tree.TREE_LEAF
+            own = np.arange(offset, offset + n)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, own, tree.children_left + offset))
+            rights.append(np.where(is_leaf, own, tree.children_right + offset))
+            if hasattr(tree, 'missing_go_to_left'):
+                missing.append(tree.missing_go_to_left.astype(bool))
+            else:
+                missing.append(np.zeros(n, dtype=bool))
+            # Même normalisation que DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :forest.n_classes_].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            probas.append(value / normalizer)
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+        return cls(
+            np.concatenate(features).astype(np.intp),
+            np.concatenate(thresholds).astype(np.float64),
+            np.concatenate(lefts).astype(np.intp),
+            np.concatenate(rights).astype(np.intp),
+            np.concatenate(missing),
+            np.concatenate(probas),
+            np.asarray(roots, dtype=np.intp),
+            np.asarray(forest.classes_),
+            max_depth,
+        )
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold,
+                 left=self.left, right=self.right, missing_left=self.missing_left,
+                 proba=self.proba, roots=self.roots, classes=self.classes_,
+                 max_depth=np.array(self.max_depth))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(npz['feature'], npz['threshold'], npz['left'], npz['right'],
+                       npz['missing_left'], npz['proba'], npz['roots'],
+                       npz['classes'], npz['max_depth'])
+
+    _ARRAYS = ('feature', 'threshold', 'left', 'right', 'missing_left', 'proba', 'roots')
+
+    def save_arrays(self, directory):
+        """Save each node array as its own .npy file, so it can be memory-mapped."""
+        os.makedirs(directory, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        np.save(os.path.join(directory, 'children.npy'), self._children())
+        np.save(os.path.join(directory, 'classes.npy'), self.classes_)
+        np.save(os.path.join(directory, 'max_depth.npy'), np.array(self.max_depth))
+
+    @classmethod
+    def load_arrays(cls, directory, mmap_mode='r'):
+        """
+        Load a forest written by save_arrays(). With mmap_mode='r' the node
+        arrays are mapped read-only, so every process scoring with the same
+        directory shares one copy of the forest in the page cache.
+        """
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in cls._ARRAYS]
+        classes = np.load(os.path.join(directory, 'classes.npy'))
+        max_depth = np.load(os.path.join(directory, 'max_depth.npy'))
+        forest = cls(*arrays, classes, max_depth)
+        forest._children_cache = np.load(os.path.join(directory, 'children.npy'),
+                                         mmap_mode=mmap_mode)
+        return forest
+
+    def _children(self):
+        # children[2 * node + 1] = fils gauche, children[2 * node] = fils droit
+        if not hasattr(self, '_children_cache'):
+            self._children_cache = np.stack([self.right, self.left], axis=1).ravel()
+        return self._children_cache
+
+    def apply(self, X):
+        """Global leaf id reached by each row in each tree, shape (n_rows, n_trees)."""
+        # Les arbres sklearn comparent X converti en float32 à des seuils float64
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_start = (np.arange(n_rows) * n_features)[:, np.newaxis]
+        has_nan = np.isnan(flat_X).any()
+        children = self._children()
+        node = np.repeat(self.roots[np.newaxis, :], n_rows, axis=0)
+        for step in range(self.max_depth):
+            x = flat_X[row_start + self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[node]
+            new_node = children[2 * node + go_left]
+            # Toutes les lignes sont arrivées sur une feuille : inutile de continuer
+            if step % 8 == 7 and np.array_equal(new_node, node):
+                break
+            node = new_node
+        return node
+
+    def predict_proba(self, X, chunk_size=4096):
+        X = np.asarray(X, dtype=np.float32)
+        proba = np.zeros((len(X), self.proba.shape[1]), dtype=np.float64)
+        # Par blocs de lignes pour borner la taille du tableau (lignes x arbres)
+        for start in range(0, len(X), chunk_size):
+            leaf_proba = self.proba[self.apply(X[start:start + chunk_size])]
+            out = proba[start:start + chunk_size]
+            # Accumulation arbre par arbre, dans l'ordre, comme RandomForestClassifier
+            for t in range(leaf_proba.shape[1]):
+                out += leaf_proba[:, t]
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def export(model_path, output_path):
+    flat = FlatForest.from_sklearn(joblib.load(model_path))
+    flat.save(output_path)
+    print(f"[*] {len(flat.roots)} trees, {len(flat.feature)} nodes exported to {output_path}")
+
+
+def benchmark(model_path, data_path, n_single=200, batch_sizes=(1, 10, 100, 1000)):
+    """Check predictions match model.predict and compare per-row latency."""
+    model = joblib.load(model_path)
+    flat = FlatForest.from_sklearn(model)
+    X = load_dataset(data_path, FEATURE_COLUMNS, target=None)
+
+    identical = np.array_equal(flat.predict(X), model.predict(X))
+    print(f"[*] Predictions identical to model.predict on {len(X)} rows: {identical}")
+
+    for batch in batch_sizes:
+        n_calls = max(1, min(n_single, len(X) // batch))
+        chunks = [X.iloc[i * batch:(i + 1) * batch] for i in range(n_calls)]
+        start = time.perf_counter()
+        for chunk in chunks:
+            model.predict(chunk)
+        sk = (time.perf_counter() - start) / (n_calls * batch)
+        arrays = [chunk.to_numpy() for chunk in chunks]
+        start = time.perf_counter()
+        for chunk in arrays:
+            flat.predict(chunk)
+        fl = (time.perf_counter() - start) / (n_calls * batch)
+        print(f"batch {batch:>5}: model.predict {sk * 1e6:9.1f} us/row, "
+              f"flat {fl * 1e6:9.1f} us/row  (x{sk / fl:.1f})")
+    return identical
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flat-array RandomForest evaluator")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="export a pickled forest to flat arrays")
+    p_export.add_argument("model", nargs="?", default="corrected_rf_model.pkl")
+    p_export.add_argument("output", nargs="?", default="flat_forest.npz")
+    p_bench = sub.add_parser("bench", help="compare against model.predict")
+    p_bench.add_argument("model", nargs="?", default="corrected_rf_model.pkl")
+    p_bench.add_argument("--data", default="kdd_processed.csv")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.model, args.output)
+    else:
+        benchmark(args.model, args.data)
@@ -0,0 +1,43 @@
+"""
+Production serving of server.py with several worker processes.
+
+Usage (from the repository directory, Ganache running):
+
+    pip install gunicorn
+    gunicorn -c gunicorn_conf.py server:app
+
+    # number of workers / address can be overridden:
+    WEB_CONCURRENCY=8 BIND=0.0.0.0:5000 gunicorn -c gunicorn_conf.py server:app
+
+The app is preloaded: the master process imports server.py once, loads
+the rules from the chain (or the local snapshot) and writes the prefix
+index to RULE_INDEX_FILE, which it memory-maps. Workers are then forked
+and share that read-only mapping instead of each rebuilding the rule
+list and its index.
+
+Metrics are per process, so a scrape would hit a random worker. Every
+process writes its metrics to METRICS_DIR (default metrics_multiproc/,
+emptied at startup) and /metrics serves them aggregated over all
+workers (see metrics.py).
+
+Measure throughput with loadtest.py, e.g.
+    python loadtest.py --url http://127.0.0.1:5000/correct_rules --concurrency 32
+"""
+import glob
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "sync"
+preload_app = True
+timeout = 120
+
+os.environ.setdefault("RULE_INDEX_FILE", "rule_index.bin")
+os.environ.setdefault("METRICS_DIR", "metrics_multiproc")
+
+
+def on_starting(server):
+    # Fichiers de métriques d'un lancement précédent
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "metrics_*.json")):
+        os.remove(path)
@@ -0,0 +1,192 @@
+"""
+Resident inference service for the corrected RandomForest (simple_ids2).
+
+The model and label encoder are loaded once. Feature rows are POSTed to
+/predict, concurrent requests are grouped into micro-batches (up to
+--max-batch rows, or --max-wait-ms after the first queued request)
+before a single model.predict call, and decoded labels are returned.
+GET /stats exposes latency percentiles and throughput counters.
+
+    python simple_ids2.py --serve --port 5001
+    curl -X POST localhost:5001/predict -H 'Content-Type: application/json' \
+         -d '{"rows": [{"src_bytes": 181, "dst_bytes": 5450, ...}]}'
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+from flask import Flask, request, jsonify
+
+
+class LatencyStats:
+    """Request counters and a bounded window of recent latencies."""
+
+    def __init__(self, window=10000):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+
+    def record_request(self, n_rows, latency):
+        with self._lock:
+            self.requests += 1
+            self.rows += n_rows
+            self._latencies.append(latency)
+
+    def record_batch(self, n_rows):
+        with self._lock:
+            self.batches += 1
+            self.batch_rows += n_rows
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            uptime = time.time() - self.started
+            stats = {
+                'requests': self.requests,
+                'rows': self.rows,
+                'batches': self.batches,
+                'mean_batch_rows': self.batch_rows / self.batches if self.batches else 0.0,
+                'uptime_s': uptime,
+                'requests_per_s': self.requests / uptime if uptime > 0 else 0.0,
+                'rows_per_s': self.rows / uptime if uptime > 0 else 0.0,
+            }
+        if len(latencies):
+            stats['latency_p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+            stats['latency_p99_ms'] = float(np.percentile(latencies, 99) * 1000)
+        return stats
+
+
+class MicroBatcher:
+    """
+    Groups rows submitted concurrently into batches for one predict call.
+
+    A background thread waits for the first pending request, then keeps
+    collecting requests until `max_batch` rows are queued or `max_wait`
+    seconds have passed, runs `predict_fn` on all of them and hands each
+    request its slice of the result. If the batch predict fails, each
+    request is predicted on its own, so only the failing ones get the error.
+    """
+
+    def __init__(self, predict_fn, max_batch=256, max_wait=0.005, stats=None):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        """Queue a 2-D array of rows; returns a Future of their predictions."""
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        n_rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_rows += len(item[0])
+        return batch, n_rows
+
+    def _run(self):
+        while True:
+            batch, n_rows = self._collect()
+            try:
+                predictions = self.predict_fn(np.concatenate([rows for rows, _ in batch]))
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # Une requête invalide ne doit pas faire échouer les autres
+                for rows, future in batch:
+                    try:
+                        future.set_result(self.predict_fn(rows))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            if self.stats is not None:
+                self.stats.record_batch(n_rows)
+            start = 0
+            for rows, future in batch:
+                future.set_result(predictions[start:start + len(rows)])
+                start += len(rows)
+
+
+def create_app(model, label_encoder, feature_columns, max_batch=256, max_wait_ms=5.0):
+    """Flask app serving `model` through a MicroBatcher."""
+    app = Flask(__name__)
+    stats = LatencyStats()
+
+    def predict(X):
+        frame = pd.DataFrame(X, columns=feature_columns)
+        return label_encoder.inverse_transform(model.predict(frame))
+
+    batcher = MicroBatcher(predict, max_batch=max_batch,
+                           max_wait=max_wait_ms / 1000.0, stats=stats)
+
+    def parse_rows(data):
+        if not isinstance(data, dict):
+            raise ValueError('request body must be an object with "rows"')
+        rows = data.get('rows', [])
+        if not isinstance(rows, list):
+            raise ValueError('"rows" must be a list')
+        if rows and isinstance(rows[0], dict):
+            missing = [c for c in feature_columns if c not in rows[0]]
+            if missing:
+                raise ValueError(f"Missing required columns: {missing}")
+            rows = [[row[c] for c in feature_columns] for row in rows]
+        X = np.asarray(rows, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(feature_columns):
+            raise ValueError(f"expected rows of {len(feature_columns)} features")
+        # sklearn prédit en float32 : une valeur hors de sa plage devient infinie
+        if not (np.abs(X) <= np.finfo(np.float32).max).all():
+            raise ValueError("feature values must be finite and fit in float32")
+        return X
+
+    @app.route('/predict', methods=['POST'])
+    def predict_route():
+        start = time.perf_counter()
+        try:
+            X = parse_rows(request.get_json(silent=True) or {})
+        except (ValueError, TypeError, KeyError) as e:
+            return jsonify({'error': str(e)}), 400
+        if len(X) == 0:
+            return jsonify({'labels': []})
+        try:
+            labels = batcher.submit(X).result()
+        except Exception as e:
+            # Échec du predict du micro-batch : erreur JSON, pas une 500 HTML
+            return jsonify({'error': f"prediction failed: {e}"}), 500
+        stats.record_request(len(X), time.perf_counter() - start)
+        return jsonify({'labels': [str(label) for label in labels]})
+
+    @app.route('/stats', methods=['GET'])
+    def stats_route():
+        return jsonify(stats.snapshot())
+
+    return app
+
+
+def serve(model, label_encoder, feature_columns, host='127.0.0.1', port=5001,
+          max_batch=256, max_wait_ms=5.0):
+    app = create_app(model, label_encoder, feature_columns, max_batch, max_wait_ms)
+    # threaded=True : chaque requête attend son micro-batch dans son propre thread
+    app.run(host=host, port=port, threaded=True)
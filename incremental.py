@@ -0,0 +1,182 @@
+"""
+Incremental alternatives to the clients' second forest fit (step 7).
+
+Today each client discards its 100-tree forest and fits a new 200-tree
+forest on the reweighted samples. retrain() keeps that behaviour as
+mode='full' and adds two modes that reuse the fitted forest:
+
+  warm_start   keep the existing trees and grow only the extra estimators
+               (n_estimators - current) on the reweighted samples
+  touched      refit only the trees with a root-to-leaf path that some
+               corrected rule extends (the trees the server's corrections
+               came from) and keep the other trees unchanged
+
+    python incremental.py --data processed_nsl_kdd_normal_malicious.csv
+    python incremental.py --synthetic 100000
+
+compares the three modes (accuracy and fit time) on one dataset.
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.utils.class_weight import compute_class_weight
+
+from dataset import FEATURE_COLUMNS, TARGET_COLUMN, load_dataset, make_synthetic
+from rule_extraction import count_forest_rules, split_rules, tree_rule_strings
+from rule_weights import compute_sample_weights
+
+RETRAIN_MODES = ('full', 'warm_start', 'touched')
+
+
+def condition_prefixes(rules):
+    """
+    Every " and "-boundary prefix of the condition of each rule, in the
+    form the server matches on ("if f1 <= 1.50 and f2 > 3.00").
+    """
+    prefixes = set()
+    for rule in rules:
+        parts = rule.split(" then")[0].strip().split(" and ")
+        for i in range(1, len(parts) + 1):
+            prefixes.add(" and ".join(parts[:i]))
+    return prefixes
+
+
+def touched_trees(forest, corrected_rules, feature_names, canonicalizer=None):
+    """
+    Indices of the trees having a path to a node whose condition prefixes
+    a corrected rule. The paths are rendered like the client's rules, so
+    pass the client's `canonicalizer` when RULE_CANONICAL is set.
+    """
+    prefixes = condition_prefixes(corrected_rules)
+    touched = []
+    for i, est in enumerate(forest.estimators_):
+        if canonicalizer is not None:
+            rules = canonicalizer.tree_rule_strings(est, forest.classes_, prefixes=True)
+        else:
+            rules = tree_rule_strings(est, feature_names, forest.classes_, prefixes=True)
+        if any(rule.split(" then")[0] in prefixes for rule in rules):
+            touched.append(i)
+    return touched
+
+
+def retrain(forest, X, y, sample_weight, corrected_rules=(), mode='full',
+            feature_names=FEATURE_COLUMNS, canonicalizer=None, **params):
+    """
+    Retrain after rule correction. `params` are the RandomForestClassifier
+    parameters of today's full refit (n_estimators=200, max_depth=10, ...).
+
+    - 'full' fits a new forest with `params` (the historical behaviour).
+    - 'warm_start' grows the fitted `forest` to params['n_estimators']
+      trees; the new trees use `params`, the existing ones are kept.
+    - 'touched' refits the trees returned by touched_trees() with `params`
+      and keeps the forest size; `canonicalizer` is the one the client's
+      rules were extracted with (None for raw rules).
+
+    The input forest is never modified; a new estimator is returned.
+    """
+    if mode not in RETRAIN_MODES:
+        raise ValueError(f"Unknown retrain mode {mode!r} (expected one of {RETRAIN_MODES})")
+    if mode == 'full':
+        model = RandomForestClassifier(**params)
+        model.fit(X, y, sample_weight=sample_weight)
+        return model
+
+    model = copy.deepcopy(forest)
+    if mode == 'warm_start':
+        n_estimators = max(params.get('n_estimators', 100), len(model.estimators_))
+        params = dict(params, n_estimators=n_estimators, warm_start=True)
+        if params.get('class_weight') == 'balanced':
+            # sklearn déconseille le preset avec warm_start : poids explicites,
+            # calculés sur toutes les données comme le ferait le refit complet
+            classes = np.unique(y)
+            params['class_weight'] = dict(zip(classes, compute_class_weight(
+                'balanced', classes=classes, y=y)))
+        model.set_params(**params)
+        model.fit(X, y, sample_weight=sample_weight)
+        model.set_params(warm_start=False)
+        return model
+
+    touched = touched_trees(model, corrected_rules, feature_names, canonicalizer)
+    if touched:
+        fresh = RandomForestClassifier(**dict(params, n_estimators=len(touched)))
+        fresh.fit(X, y, sample_weight=sample_weight)
+        if not np.array_equal(fresh.classes_, model.classes_):
+            raise ValueError("Retraining data does not have the forest's classes")
+        for i, est in zip(touched, fresh.estimators_):
+            model.estimators_[i] = est
+    print(f"Arbres réentraînés : {len(touched)}/{len(model.estimators_)}")
+    return model
+
+
+def compare(X, y, corrected_rules=None, factor=1.5, seed=42, corrected_fraction=0.01):
+    """
+    Fit the initial 100-tree forest like the clients, then run each retrain
+    mode and print its fit time and test accuracy. Without `corrected_rules`,
+    a random `corrected_fraction` of the initial forest's uncertain rules
+    stands in for the server's answer.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=seed)
+    rf = RandomForestClassifier(n_estimators=100, random_state=seed, n_jobs=-1)
+    start = time.perf_counter()
+    rf.fit(X_train, y_train)
+    initial_time = time.perf_counter() - start
+    acc_before = accuracy_score(y_test, rf.predict(X_test))
+
+    if corrected_rules is None:
+        counts = count_forest_rules(rf, list(X.columns))
+        uncertain = split_rules(counts, len(rf.estimators_), 0.5)[1]
+        rng = np.random.default_rng(seed)
+        n_corrected = max(1, int(len(uncertain) * corrected_fraction))
+        corrected_rules = [uncertain[i] for i in
+                           sorted(rng.choice(len(uncertain), n_corrected, replace=False))]
+    weights = compute_sample_weights(X_train, corrected_rules, factor=factor)
+    params = dict(n_estimators=200, max_depth=10, class_weight='balanced',
+                  random_state=seed, n_jobs=-1)
+
+    print(f"Forêt initiale : {initial_time:.2f}s, accuracy {acc_before:.4f}, "
+          f"{len(corrected_rules)} règles corrigées")
+    results = []
+    for mode in RETRAIN_MODES:
+        start = time.perf_counter()
+        model = retrain(rf, X_train, y_train, weights, corrected_rules, mode,
+                        list(X.columns), **params)
+        fit_time = time.perf_counter() - start
+        acc = accuracy_score(y_test, model.predict(X_test))
+        results.append({'mode': mode, 'seconds': fit_time, 'accuracy': acc,
+                        'n_estimators': len(model.estimators_)})
+    full_time = results[0]['seconds']
+    print(f"\n{'mode':<12} {'arbres':>7} {'temps (s)':>10} {'vs full':>8} {'accuracy':>9}")
+    for r in results:
+        print(f"{r['mode']:<12} {r['n_estimators']:>7} {r['seconds']:10.2f} "
+              f"{full_time / r['seconds']:7.1f}x {r['accuracy']:9.4f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare full and incremental retraining")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--data", default="processed_nsl_kdd_normal_malicious.csv")
+    source.add_argument("--synthetic", type=int, metavar="ROWS",
+                        help="use a synthetic NSL-KDD shaped dataset instead of --data")
+    parser.add_argument("--rules", help="corrected rules file (one per line); "
+                                        "default: a sample of the initial forest's uncertain rules")
+    parser.add_argument("--corrected-fraction", type=float, default=0.01,
+                        help="without --rules, fraction of the uncertain rules used as corrections")
+    parser.add_argument("--factor", type=float, default=1.5)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        df = make_synthetic(args.synthetic)
+    else:
+        df = load_dataset(args.data, FEATURE_COLUMNS, TARGET_COLUMN)
+    rules = None
+    if args.rules:
+        with open(args.rules) as f:
+            rules = [line.strip() for line in f if line.strip()]
+    compare(df[FEATURE_COLUMNS], df[TARGET_COLUMN], rules, args.factor,
+            corrected_fraction=args.corrected_fraction)
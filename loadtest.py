@@ -0,0 +1,75 @@
+"""
+Simple load generator for the /correct_rules endpoint.
+
+    python loadtest.py --url http://127.0.0.1:5000/correct_rules \
+        --concurrency 32 --requests 2000 --rules-per-request 300
+
+Prints requests/sec and latency percentiles, for the dev server or for
+gunicorn with a given WEB_CONCURRENCY. Workers only add throughput when
+the host has free cores: run the load generator on other cores than the
+server.
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from dataset import FEATURE_COLUMNS
+
+
+def synthetic_uncertain_rules(n, seed):
+    """Rule strings shaped like the clients' uncertain rules."""
+    rng = random.Random(seed)
+    rules = []
+    for _ in range(n):
+        depth = rng.randint(1, 6)
+        conds = [
+            f"{rng.choice(FEATURE_COLUMNS)} {rng.choice(['<=', '>'])} {rng.uniform(0, 100):.2f}"
+            for _ in range(depth)
+        ]
+        rules.append(f"if {' and '.join(conds)} then class: {rng.choice(['normal', 'malicious'])}")
+    return rules
+
+
+def run(url, concurrency, n_requests, rules_per_request, distinct_payloads=1000):
+    payloads = [
+        {'uncertain_rules': synthetic_uncertain_rules(rules_per_request, seed)}
+        for seed in range(distinct_payloads)
+    ]
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        resp = local.session.post(url, json=payloads[i % len(payloads)])
+        resp.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(one, range(n_requests))))
+    elapsed = time.perf_counter() - start
+
+    print(f"{n_requests} requests, concurrency {concurrency}: "
+          f"{n_requests / elapsed:.1f} req/s")
+    print(f"latency p50 {np.percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99 {np.percentile(latencies, 99) * 1000:.1f} ms")
+    return n_requests / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test /correct_rules")
+    parser.add_argument('--url', default='http://127.0.0.1:5000/correct_rules')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rules-per-request', type=int, default=300)
+    parser.add_argument('--distinct-payloads', type=int, default=1000,
+                        help="identical payloads are served from the server's response cache")
+    args = parser.parse_args()
+    run(args.url, args.concurrency, args.requests, args.rules_per_request,
+        args.distinct_payloads)
@@ -0,0 +1,136 @@
+"""
+Merkle-batched anchoring of rule sets on the RandomForestRules contract.
+
+A batch of rules is written to a local content-addressed blob store and
+a single addRule transaction stores its anchor on chain:
+
+    merkle:v1:<merkle root>:<blob sha256>:<rule count>
+
+Only an entry of exactly that shape is an anchor, and uploadrules.py
+refuses to store a plain rule starting with "merkle:v1:", so a rule can
+never be read back as an anchor.
+
+The blob is the batch's rules in UTF-8, one per line. The Merkle root is
+computed over the rules: a leaf is sha256(0x00 || rule) and a node is
+sha256(0x01 || left || right), with an odd node promoted unchanged.
+Readers (server.py) fetch the blob by its sha256, check the blob hash,
+then recompute the root from the rules and compare it with the on-chain
+one. This verifies every rule of the batch against the anchor, so a
+rule cannot be added, dropped, reordered or altered in the blob.
+merkle_proof() / verify_proof() check a single rule without the others.
+
+    python uploadrules.py certain_rules.txt --anchor --blob-dir rule_blobs
+"""
+import hashlib
+import os
+import re
+
+ANCHOR_PREFIX = "merkle:v1:"
+BLOB_DIR = os.environ.get("RULE_BLOB_DIR", "rule_blobs")
+_ANCHOR_RE = re.compile(re.escape(ANCHOR_PREFIX) + r'[0-9a-f]{64}:[0-9a-f]{64}:[0-9]+')
+
+
+def _leaf(rule):
+    return hashlib.sha256(b'\x00' + rule.encode('utf-8')).digest()
+
+
+def _node(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _next_level(level):
+    nxt = [_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        nxt.append(level[-1])
+    return nxt
+
+
+def merkle_root(rules):
+    """Hex Merkle root of a list of rule strings (sha256 of b'' if empty)."""
+    level = [_leaf(r) for r in rules]
+    if not level:
+        return hashlib.sha256(b'').hexdigest()
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0].hex()
+
+
+def merkle_proof(rules, index):
+    """Sibling path of rules[index]: list of (sibling hex, sibling_is_left)."""
+    level = [_leaf(r) for r in rules]
+    proof = []
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append((level[sibling].hex(), sibling < index))
+        level = _next_level(level)
+        index //= 2
+    return proof
+
+
+def verify_proof(rule, proof, root):
+    digest = _leaf(rule)
+    for sibling_hex, sibling_is_left in proof:
+        sibling = bytes.fromhex(sibling_hex)
+        digest = _node(sibling, digest) if sibling_is_left else _node(digest, sibling)
+    return digest.hex() == root
+
+
+class BlobStore:
+    """Content-addressed files: <root>/<sha[:2]>/<sha>."""
+
+    def __init__(self, root=BLOB_DIR):
+        self.root = root
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest):
+        """Blob content; raises KeyError if missing or corrupted."""
+        try:
+            with open(self._path(digest), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise KeyError(f"blob {digest} not found in {self.root}")
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise KeyError(f"blob {digest} is corrupted")
+        return data
+
+
+def make_anchor(rules, store):
+    """Store the batch blob and return its on-chain anchor string."""
+    blob = "".join(r + "\n" for r in rules).encode('utf-8')
+    blob_ref = store.put(blob)
+    return f"{ANCHOR_PREFIX}{merkle_root(rules)}:{blob_ref}:{len(rules)}"
+
+
+def is_anchor(content):
+    return _ANCHOR_RE.fullmatch(content) is not None
+
+
+def resolve_anchor(anchor, store):
+    """
+    Rules of an anchored batch, read from `store` and verified against the
+    anchor. Raises ValueError if the anchor is malformed or the blob does
+    not match it, KeyError if the blob is missing.
+    """
+    try:
+        root, blob_ref, count = anchor[len(ANCHOR_PREFIX):].split(':')
+        count = int(count)
+    except ValueError:
+        raise ValueError(f"malformed anchor {anchor!r}")
+    rules = store.get(blob_ref).decode('utf-8').split('\n')[:-1]
+    if len(rules) != count or merkle_root(rules) != root:
+        raise ValueError(f"batch {blob_ref} does not match its on-chain Merkle root")
+    return rules
@@ -0,0 +1,239 @@
+"""
+Minimal Prometheus metrics (counters, gauges, histograms) rendered in the
+text exposition format, without depending on prometheus_client.
+
+Each update is one lock acquisition and, for histograms, one bisect over
+the bucket bounds, so instrumentation can stay on in production.
+
+Values are per process. Under gunicorn, Registry.enable_multiprocess(dir)
+makes every process write its values to <dir>/metrics_<pid>.json (before
+each fork, every `interval` seconds in the forked workers, and on each
+scrape), and render() merges all of them: counters and histograms are
+summed over the processes, gauges take their maximum. The other
+processes' values can lag by up to `interval` seconds. A forked worker
+starts its counters and histograms from zero, so what the master recorded
+before the fork (startup load) is counted once, from the master's file.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Secondes, de 0.5 ms à 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Nombre d'éléments (règles) dans une requête ou une réponse
+SIZE_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        """[[label values, value], ...], JSON-serializable."""
+        with self._lock:
+            return [[list(key), json.loads(json.dumps(value))]
+                    for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self, values=None):
+        """Exposition lines of this process's values, or of `values` {key: value}."""
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @staticmethod
+    def merge(a, b):
+        return max(a, b)
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS,
+                 registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [compteurs par bucket (non cumulés, +Inf inclus), somme, nombre]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, state):
+        counts, total, n = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+class Registry:
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = []
+        self._dir = None
+        self._interval = 1.0
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def enable_multiprocess(self, directory, interval=1.0):
+        """Share the values of all processes through files in `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        self._dir = directory
+        self._interval = interval
+        os.register_at_fork(before=self.write_snapshot, after_in_child=self._after_fork)
+
+    def _path(self, pid):
+        return os.path.join(self._dir, f"metrics_{pid}.json")
+
+    def write_snapshot(self):
+        if self._dir is None:
+            return
+        path = self._path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({m.name: m.snapshot() for m in self._metrics}, f)
+        os.replace(tmp_path, path)
+
+    def _after_fork(self):
+        # Les valeurs d'avant le fork sont dans le fichier du parent
+        for metric in self._metrics:
+            if not isinstance(metric, Gauge):
+                metric.reset()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+
+    def _merged(self):
+        """{metric name: {key: value}} over the files of every process."""
+        self.write_snapshot()
+        merged = {m.name: {} for m in self._metrics}
+        kinds = {m.name: m for m in self._metrics}
+        for path in glob.glob(os.path.join(self._dir, 'metrics_*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, samples in snapshot.items():
+                if name not in kinds:
+                    continue
+                values = merged[name]
+                for key, value in samples:
+                    key = tuple(key)
+                    values[key] = kinds[name].merge(values[key], value) \
+                        if key in values else value
+        return merged
+
+    def render(self):
+        merged = self._merged() if self._dir is not None else None
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(None if merged is None else merged[metric.name]))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,135 @@
+"""
+Opt-in per-stage profiling for the federated clients.
+
+The clients call profiler.stage("3) Entraînement initial") at the start
+of each numbered step and profiler.finish() at the end. When CLIENT_PROFILE=1
+each stage records its wall time, CPU time (all threads of the process)
+and peak RSS. finish() prints a summary table and writes a JSON report.
+
+  CLIENT_PROFILE=1                  enable profiling (otherwise every call is a no-op)
+  CLIENT_PROFILE_REPORT=<path>      JSON report (default profile_<client>.json)
+  CLIENT_PROFILE_PSTATS=<path>      also run cProfile on each stage and dump the
+                                    pstats of the slowest one (python -m pstats <path>)
+
+CPU time does not include joblib/loky worker processes. cProfile only sees
+the main thread, and it slows down Python-heavy stages while enabled.
+"""
+import cProfile
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS counter (Linux >= 4.0), if possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    """Peak resident set size in bytes (since the last reset when supported)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets ailleurs
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageProfiler:
+    """Records wall time, CPU time and peak RSS of consecutive stages."""
+
+    def __init__(self, name, enabled=False, report_path=None, pstats_path=None):
+        self.name = name
+        self.enabled = enabled
+        self.report_path = report_path or f"profile_{name}.json"
+        self.pstats_path = pstats_path
+        self.stages = []
+        self._current = None
+        self._slowest_profile = None
+        self._peak_resets = False
+
+    @classmethod
+    def from_env(cls, name):
+        return cls(name,
+                   enabled=os.environ.get("CLIENT_PROFILE", "0") == "1",
+                   report_path=os.environ.get("CLIENT_PROFILE_REPORT"),
+                   pstats_path=os.environ.get("CLIENT_PROFILE_PSTATS"))
+
+    def stage(self, label):
+        """End the current stage (if any) and start a new one called `label`."""
+        if not self.enabled:
+            return
+        self._end_stage()
+        self._peak_resets = _reset_peak_rss()
+        profile = None
+        if self.pstats_path:
+            profile = cProfile.Profile()
+            profile.enable()
+        self._current = (label, time.perf_counter(), time.process_time(), profile)
+
+    def _end_stage(self):
+        if self._current is None:
+            return
+        label, wall_start, cpu_start, profile = self._current
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        if profile is not None:
+            profile.disable()
+        self.stages.append({
+            'stage': label,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            # Sans remise à zéro du pic, c'est le pic depuis le début du processus
+            'peak_rss_bytes': _peak_rss(),
+            'peak_rss_scope': 'stage' if self._peak_resets else 'process',
+        })
+        if profile is not None and (self._slowest_profile is None
+                                    or wall > self._slowest_profile[0]):
+            self._slowest_profile = (wall, label, profile)
+        self._current = None
+
+    def finish(self):
+        """End the last stage, print the summary table and write the reports."""
+        if not self.enabled:
+            return None
+        self._end_stage()
+        total = sum(s['wall_seconds'] for s in self.stages) or 1.0
+
+        print(f"\n=== Profil par étape ({self.name}) ===")
+        print(f"{'étape':<45} {'wall (s)':>9} {'cpu (s)':>9} {'cpu/wall':>8} "
+              f"{'pic RSS (Mo)':>12} {'%':>6}")
+        for s in self.stages:
+            ratio = s['cpu_seconds'] / s['wall_seconds'] if s['wall_seconds'] > 0 else 0.0
+            print(f"{s['stage'][:45]:<45} {s['wall_seconds']:9.2f} {s['cpu_seconds']:9.2f} "
+                  f"{ratio:8.2f} {s['peak_rss_bytes'] / 2**20:12.1f} "
+                  f"{100 * s['wall_seconds'] / total:6.1f}")
+
+        report = {
+            'client': self.name,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'total_wall_seconds': sum(s['wall_seconds'] for s in self.stages),
+            'stages': self.stages,
+        }
+        if self._slowest_profile is not None:
+            wall, label, profile = self._slowest_profile
+            profile.dump_stats(self.pstats_path)
+            report['pstats'] = {'stage': label, 'path': self.pstats_path}
+            print(f"cProfile de l'étape la plus lente ({label}) -> {self.pstats_path}")
+        with open(self.report_path, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Rapport JSON -> {self.report_path}")
+        return report
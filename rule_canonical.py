@@ -0,0 +1,239 @@
+"""
+Rule canonicalization and threshold bucketing.
+
+Raw rules are root-to-leaf paths rendered with the split thresholds of
+each tree, so "src_bytes <= 28.50" and "src_bytes <= 28.75" from two trees
+are different rules, as are two paths testing the same features in a
+different order. A RuleCanonicalizer rewrites each path as:
+
+  - thresholds optionally bucketed, to a number of significant digits
+    (data-independent) or to the nearest per-feature quantile edge;
+  - the splits in root-to-leaf order, minus those that no longer tighten
+    the bounds of their feature once bucketed.
+
+The path order is kept in the rule string because the server matches an
+uncertain rule against the stored rules that start with it: the string of
+a node must stay a prefix of the strings of the nodes below it. Equivalent
+paths are merged on a dedup key instead, the label plus one interval
+"low < f <= high" per feature in feature_names order, so they are counted,
+sent and stored once, under the string of the first path seen.
+
+Paths whose bucketed interval is empty are dropped. Canonical rules keep the
+"if ... then class: ..." grammar, so the server's prefix matching and the
+clients' sample weighting work unchanged. All parties must use the same spec.
+Quantile edges depend on the data they were computed on, so for federated
+use prefer precision:N, or compute the edges on shared reference data.
+
+Specs (RULE_CANONICAL environment variable of the clients and extract_rules.py):
+
+  none           raw rules (historical behaviour)
+  exact          canonical form, thresholds rounded to 2 decimals only
+  precision:N    thresholds rounded to N significant digits
+  quantile:N     thresholds snapped to the nearest of N per-feature quantiles
+
+    python rule_canonical.py --synthetic 30000
+
+reports rule counts, payload sizes and final accuracy for several specs.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from dataset import FEATURE_COLUMNS, TARGET_COLUMN, load_dataset, make_synthetic
+from rule_extraction import count_forest_rules, split_rules, tree_rules
+from rule_index import RuleIndex
+from rule_weights import compute_sample_weights
+
+
+class ThresholdBuckets:
+    """Maps a split threshold to the representative value of its bucket."""
+
+    def __init__(self, significant_digits=None, edges=None):
+        self.significant_digits = significant_digits
+        # {feature: bords triés} pour le mode quantiles
+        self.edges = edges
+
+    @classmethod
+    def quantiles(cls, X, feature_names, n_quantiles=32):
+        qs = np.linspace(0.0, 1.0, n_quantiles + 1)
+        edges = {f: np.unique(np.quantile(np.asarray(X[f], dtype=np.float64), qs))
+                 for f in feature_names}
+        return cls(edges=edges)
+
+    def __call__(self, feature, threshold):
+        if self.edges is not None:
+            edges = self.edges[feature]
+            i = int(np.searchsorted(edges, threshold))
+            if i == 0:
+                return float(edges[0])
+            if i == len(edges):
+                return float(edges[-1])
+            lo, hi = edges[i - 1], edges[i]
+            return float(lo if threshold - lo <= hi - threshold else hi)
+        if self.significant_digits is not None:
+            return float(f"{threshold:.{self.significant_digits}g}")
+        return threshold
+
+
+class RuleCanonicalizer:
+    """Turns Rules into canonical rule strings (see the module docstring)."""
+
+    def __init__(self, feature_names, buckets=None, decimals=2):
+        self.feature_names = list(feature_names)
+        self.order = {f: i for i, f in enumerate(self.feature_names)}
+        self.buckets = buckets
+        self.decimals = decimals
+
+    def conditions(self, conditions):
+        """
+        (path, bounds) of a condition tuple, or None if it can never match:
+        path holds the bucketed splits that tighten a bound, in their
+        original order, bounds the resulting interval of each feature in
+        feature_names order.
+        """
+        bounds = {}
+        path = []
+        for feature, op, t in conditions:
+            if self.buckets is not None:
+                t = self.buckets(feature, t)
+            # Arrondi d'affichage appliqué avant la fusion : le texte reste cohérent
+            t = round(t, self.decimals)
+            low, high = bounds.get(feature, (-np.inf, np.inf))
+            if op == '<=':
+                if t >= high:
+                    continue
+                high = t
+            else:
+                if t <= low:
+                    continue
+                low = t
+            if low >= high:
+                return None
+            bounds[feature] = (low, high)
+            path.append((feature, op, t))
+        return tuple(path), tuple((f, bounds[f]) for f in sorted(bounds, key=self.order.__getitem__))
+
+    def canonical(self, rule):
+        """(dedup key, rule string) of a Rule, or None if it is dropped."""
+        canonical = self.conditions(rule.conditions)
+        if canonical is None or not canonical[0]:
+            return None
+        path, bounds = canonical
+        cond = " and ".join(f"{f} {op} {t:.{self.decimals}f}" for f, op, t in path)
+        return (bounds, str(rule.label)), f"if {cond} then class: {rule.label}"
+
+    def format(self, rule):
+        canonical = self.canonical(rule)
+        return None if canonical is None else canonical[1]
+
+    def tree_rule_keys(self, estimator, class_names=None, prefixes=False):
+        """(dedup key, rule string) pairs of a fitted tree (empty paths dropped)."""
+        rules = (self.canonical(r)
+                 for r in tree_rules(estimator, self.feature_names, class_names, prefixes))
+        return [r for r in rules if r is not None]
+
+    def tree_rule_strings(self, estimator, class_names=None, prefixes=False):
+        """Canonical rule strings of a fitted tree (empty paths dropped)."""
+        return [rule for _, rule in self.tree_rule_keys(estimator, class_names, prefixes)]
+
+
+def canonicalizer_from_spec(spec, feature_names=FEATURE_COLUMNS, X=None):
+    """
+    RuleCanonicalizer for a spec string (none, exact, precision:N,
+    quantile:N); None for "none". quantile:N needs the data X.
+    """
+    spec = (spec or 'none').strip().lower()
+    kind, _, arg = spec.partition(':')
+    if kind == 'none':
+        return None
+    if kind == 'exact':
+        return RuleCanonicalizer(feature_names)
+    if kind == 'precision':
+        return RuleCanonicalizer(feature_names, ThresholdBuckets(significant_digits=int(arg or 3)))
+    if kind == 'quantile':
+        if X is None:
+            raise ValueError("quantile bucketing needs the training data")
+        return RuleCanonicalizer(feature_names,
+                                 ThresholdBuckets.quantiles(X, feature_names, int(arg or 32)))
+    raise ValueError(f"Unknown rule canonicalization spec {spec!r} "
+                     "(none, exact, precision:N or quantile:N)")
+
+
+def report(X, y, specs, factor=1.5, seed=42):
+    """
+    Run the federated round offline for each canonicalization spec: a peer
+    forest's rules play the on-chain store, the local forest's uncertain
+    rules are matched against them like /correct_rules does, and the
+    corrected rules weight the 200-tree refit. Prints rule counts, request
+    and response payload sizes, and accuracy.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=seed)
+    columns = list(X.columns)
+    local = RandomForestClassifier(n_estimators=100, random_state=seed, n_jobs=-1)
+    local.fit(X_train, y_train)
+    peer = RandomForestClassifier(n_estimators=100, random_state=seed + 1, n_jobs=-1)
+    peer.fit(X_train, y_train)
+    acc_before = accuracy_score(y_test, local.predict(X_test))
+    print(f"Accuracy avant correction : {acc_before:.4f}")
+
+    results = []
+    for spec in specs:
+        start = time.perf_counter()
+        canon = canonicalizer_from_spec(spec, columns, X_train)
+        stored = list(count_forest_rules(peer, columns, per_tree_unique=True, canonicalizer=canon))
+        counts = count_forest_rules(local, columns, canonicalizer=canon, prefixes=True)
+        _, uncertain = split_rules(counts, len(local.estimators_), 0.5)
+        index = RuleIndex(stored)
+        corrected = list(dict.fromkeys(
+            r for ur in uncertain for r in index.match(ur.split(" then")[0].strip())))
+        extract_time = time.perf_counter() - start
+
+        weights = compute_sample_weights(X_train, corrected, factor=factor)
+        rf2 = RandomForestClassifier(n_estimators=200, max_depth=10, class_weight='balanced',
+                                     random_state=seed, n_jobs=-1)
+        rf2.fit(X_train, y_train, sample_weight=weights)
+        results.append({
+            'spec': spec,
+            'distinct_rules': len(counts),
+            'stored_rules': len(stored),
+            'uncertain_rules': len(uncertain),
+            'corrected_rules': len(corrected),
+            'request_bytes': len(json.dumps({'uncertain_rules': uncertain})),
+            'response_bytes': len(json.dumps({'corrected_rules': corrected})),
+            'extract_seconds': extract_time,
+            'accuracy': accuracy_score(y_test, rf2.predict(X_test)),
+        })
+
+    base = results[0]
+    print(f"\n{'spec':<14} {'règles':>8} {'stockées':>9} {'incert.':>8} {'corrig.':>8} "
+          f"{'requête':>10} {'réduction':>10} {'accuracy':>9}")
+    for r in results:
+        reduction = 1 - r['request_bytes'] / base['request_bytes'] if base['request_bytes'] else 0.0
+        print(f"{r['spec']:<14} {r['distinct_rules']:>8} {r['stored_rules']:>9} "
+              f"{r['uncertain_rules']:>8} {r['corrected_rules']:>8} "
+              f"{r['request_bytes'] / 1024:8.0f}Ko {100 * reduction:9.1f}% {r['accuracy']:9.4f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare rule canonicalization specs")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--data", default="processed_nsl_kdd_normal_malicious.csv")
+    source.add_argument("--synthetic", type=int, metavar="ROWS",
+                        help="use a synthetic NSL-KDD shaped dataset instead of --data")
+    parser.add_argument("--specs", nargs="+",
+                        default=['none', 'exact', 'precision:3', 'precision:2',
+                                 'quantile:64', 'quantile:16'])
+    parser.add_argument("--factor", type=float, default=1.5)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        df = make_synthetic(args.synthetic)
+    else:
+        df = load_dataset(args.data, FEATURE_COLUMNS, TARGET_COLUMN)
+    report(df[FEATURE_COLUMNS], df[TARGET_COLUMN], args.specs, args.factor)
@@ -0,0 +1,191 @@
+from collections import Counter, namedtuple
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.tree import _tree
+
+# Une règle = chemin racine -> noeud d'un arbre (une feuille par défaut).
+# conditions : tuple de (feature, opérateur, seuil), label : classe majoritaire du noeud
+Rule = namedtuple('Rule', ['conditions', 'label'])
+
+
+def tree_rules(estimator, feature_names, class_names=None, prefixes=False):
+    """
+    Extract every root-to-leaf path of a fitted decision tree as a Rule.
+
+    Reads estimator.tree_ (feature, threshold, children_left,
+    children_right, value) directly instead of rendering export_text.
+    `class_names` maps class indices to labels; by default the
+    estimator's classes_ are used. For the trees of a RandomForest,
+    pass forest.classes_, since each sub-estimator only knows the
+    encoded class indices.
+
+    With `prefixes`, the path to every node below the root is a Rule too,
+    labeled with the node's majority class, like the per-node lines
+    export_text used to produce. The root itself has an empty path and
+    is never a rule: its condition "if" would prefix-match every rule
+    on the server, so a tree reduced to its root yields no rule.
+    """
+    tree = estimator.tree_
+    if class_names is None:
+        class_names = estimator.classes_
+    feature = tree.feature.tolist()
+    threshold = tree.threshold.tolist()
+    left = tree.children_left.tolist()
+    right = tree.children_right.tolist()
+    node_class = np.argmax(tree.value[:, 0, :], axis=1).tolist()
+
+    rules = []
+    # Parcours en profondeur avec le chemin courant (pas de récursion)
+    stack = [(0, ())]
+    while stack:
+        node, path = stack.pop()
+        is_leaf = left[node] == _tree.TREE_LEAF
+        if path and (is_leaf or prefixes):
+            rules.append(Rule(path, class_names[node_class[node]]))
+        if is_leaf:
+            continue
+        name = feature_names[feature[node]]
+        t = threshold[node]
+        stack.append((right[node], path + ((name, '>', t),)))
+        stack.append((left[node], path + ((name, '<=', t),)))
+    return rules
+
+
+def format_condition(conditions, decimals=2):
+    """Canonical text of a condition: "f1 <= 1.50 and f2 > 3.00"."""
+    return " and ".join(
+        f"{name} {op} {t:.{decimals}f}" for name, op, t in conditions
+    )
+
+
+def format_rule(rule, decimals=2):
+    """
+    Canonical text form of a Rule, e.g.
+    "if src_bytes <= 28.50 and dst_bytes > 3.00 then class: normal".
+
+    Thresholds are rounded like export_text (decimals=2), so equal
+    splits of different trees give the same string. The condition part
+    is what the server prefix-matches and what the clients evaluate to
+    weight samples.
+    """
+    return f"if {format_condition(rule.conditions, decimals)} then class: {rule.label}"
+
+
+def tree_rule_strings(estimator, feature_names, class_names=None, decimals=2,
+                      prefixes=False):
+    """
+    Canonical rule strings of a fitted tree, equal to
+    [format_rule(r, decimals) for r in tree_rules(...)] but faster:
+    each split is formatted once and the path text is built while
+    walking down the tree.
+    """
+    tree = estimator.tree_
+    if class_names is None:
+        class_names = estimator.classes_
+    feature = tree.feature.tolist()
+    threshold = tree.threshold.tolist()
+    left = tree.children_left.tolist()
+    right = tree.children_right.tolist()
+    node_class = np.argmax(tree.value[:, 0, :], axis=1).tolist()
+    labels = [f" then class: {c}" for c in class_names]
+
+    rules = []
+    stack = [(0, "if ")]
+    while stack:
+        node, text = stack.pop()
+        is_leaf = left[node] == _tree.TREE_LEAF
+        # La racine (texte "if ") n'est jamais une règle, voir tree_rules
+        if text != "if " and (is_leaf or prefixes):
+            rules.append(text + labels[node_class[node]])
+        if is_leaf:
+            continue
+        split = f"{feature_names[feature[node]]} {{}} {threshold[node]:.{decimals}f}"
+        sep = "" if text == "if " else " and "
+        stack.append((right[node], text + sep + split.format('>')))
+        stack.append((left[node], text + sep + split.format('<=')))
+    return rules
+
+
+def forest_rules(forest, feature_names, decimals=2):
+    """Canonical rule strings of each tree of a fitted forest (one list per tree)."""
+    return [
+        tree_rule_strings(est, feature_names, forest.classes_, decimals)
+        for est in forest.estimators_
+    ]
+
+
+def _count_chunk(estimators, feature_names, class_names, decimals, per_tree_unique,
+                 canonicalizer=None, prefixes=False):
+    """(Counter by dedup key, {key: first rule string seen}) for some trees."""
+    counts = Counter()
+    strings = {}
+    for est in estimators:
+        if canonicalizer is not None:
+            pairs = canonicalizer.tree_rule_keys(est, class_names, prefixes)
+        else:
+            # Sans canonicalisation, la clé est la chaîne elle-même
+            pairs = [(r, r) for r in
+                     tree_rule_strings(est, feature_names, class_names, decimals, prefixes)]
+        for key, rule in pairs:
+            strings.setdefault(key, rule)
+        keys = [key for key, _ in pairs]
+        counts.update(dict.fromkeys(keys, 1) if per_tree_unique else keys)
+    return counts, strings
+
+
+def _merge_counts(partials):
+    """Merge _count_chunk results in tree order into a Counter of rule strings."""
+    counts = Counter()
+    strings = {}
+    for partial, partial_strings in partials:
+        counts.update(partial)
+        for key, rule in partial_strings.items():
+            strings.setdefault(key, rule)
+    return Counter({strings[key]: count for key, count in counts.items()})
+
+
+def count_forest_rules(forest, feature_names, n_jobs=None, per_tree_unique=False,
+                       decimals=2, canonicalizer=None, prefixes=False):
+    """
+    Count the canonical rules of all trees of a fitted forest.
+
+    The estimators are split into contiguous chunks extracted on a
+    process pool (`n_jobs`, defaulting to the forest's own n_jobs) and
+    the per-chunk Counters are merged in tree order, so the result
+    (counts and first-seen order) equals a serial loop. With
+    `per_tree_unique`, a rule counts at most once per tree, i.e. the
+    count is the number of trees containing it.
+
+    With a `canonicalizer` (rule_canonical.RuleCanonicalizer), rules are
+    counted in canonical form and equivalent paths of different trees
+    are merged on its dedup key, under the first rule string seen. With `prefixes`, the path to every node is counted, not
+    only the root-to-leaf paths (see tree_rules).
+    """
+    if n_jobs is None:
+        n_jobs = forest.n_jobs
+    estimators = forest.estimators_
+    n_chunks = min(effective_n_jobs(n_jobs), len(estimators))
+    if n_chunks <= 1:
+        return _merge_counts([_count_chunk(estimators, feature_names, forest.classes_,
+                                           decimals, per_tree_unique, canonicalizer, prefixes)])
+
+    bounds = np.linspace(0, len(estimators), n_chunks + 1).astype(int)
+    partials = Parallel(n_jobs=n_chunks)(
+        delayed(_count_chunk)(estimators[lo:hi], feature_names, forest.classes_,
+                              decimals, per_tree_unique, canonicalizer, prefixes)
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    )
+    return _merge_counts(partials)
+
+
+def split_rules(counts, n_trees, ratio=0.5):
+    """
+    Split counted rules at `ratio` * n_trees: returns (certain, uncertain)
+    where certain rules have a count above the threshold and uncertain
+    ones a count below it (rules exactly at the threshold are in neither).
+    """
+    threshold = n_trees * ratio
+    certain = [r for r, cnt in counts.items() if cnt > threshold]
+    uncertain = [r for r, cnt in counts.items() if cnt < threshold]
+    return certain, uncertain
@@ -0,0 +1,291 @@
+"""
+Two-tier classifier: certain rules first, the RandomForest for the rest.
+
+The certain rules written by extract_rules.py (certain_rules.txt) are
+compiled into a vectorized interval lookup. Each rule is a box
+lo < x <= hi per feature. For each feature, the sorted rule thresholds
+split the axis into bins, and every bin stores a bitset of the rules whose
+interval contains it. A row is binned with one searchsorted per feature,
+and the rules it matches are the AND of the bitsets of its bins.
+
+A row is labeled by the rules when it matches at least one rule and all
+the rules it matches agree on the class. Every other row (no match,
+conflicting rules, NaN feature) goes to model.predict. Rules outside the
+supported grammar ('!=', eval fallback) or whose class the model does not
+know are skipped.
+
+A certain rule is one that many trees share, which says nothing about how
+pure its class is: a one-split rule can be "certain" and still be wrong on
+a large share of the rows it covers. extract_rules.py therefore records
+the purity of each rule, the share of the training rows it matches that
+have its class, in a file next to the rules (certain_rules_purity.json),
+and only the rules with a purity of at least MIN_RULE_PURITY are compiled.
+Rules without a recorded purity are skipped.
+
+Rule thresholds are rounded (2 decimals by default), so the rules can
+disagree with the forest near a split: `benchmark` reports the agreement
+along with the coverage and the throughput of both paths.
+
+    python rule_fastpath.py corrected_rf_model.pkl certain_rules.txt --data output_features.csv
+"""
+import argparse
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+
+from dataset import FEATURE_COLUMNS, load_dataset
+from rule_weights import parse_condition, rule_condition, rule_mask
+
+# Pureté minimale (part des lignes d'entraînement couvertes ayant la classe
+# de la règle) pour qu'une règle réponde à la place de la forêt
+MIN_RULE_PURITY = float(os.environ.get('MIN_RULE_PURITY', '0.99'))
+
+
+def rule_label(rule):
+    """Class of a rule string: the text after "then", without "class:"."""
+    _, sep, conclusion = rule.partition(" then")
+    if not sep:
+        return None
+    conclusion = conclusion.strip()
+    if conclusion.startswith("class:"):
+        conclusion = conclusion[len("class:"):]
+    return conclusion.strip()
+
+
+def rule_box(predicates, feature_columns):
+    """
+    {feature index: (lo, hi)} with lo < x <= hi for a predicate list,
+    or None if it is not a box ('!=', unknown feature) or it is empty.
+    """
+    box = {}
+    for feature, op, threshold in predicates:
+        if feature not in feature_columns or op == '!=':
+            return None
+        t = float(threshold)
+        below = np.nextafter(t, -np.inf)   # x < t  <=>  x <= below
+        lo, hi = box.get(feature_columns.index(feature), (-np.inf, np.inf))
+        if op in ('<=', '<', '=='):
+            hi = min(hi, t if op != '<' else below)
+        if op in ('>', '>=', '=='):
+            lo = max(lo, t if op == '>' else below)
+        if lo >= hi:
+            return None
+        box[feature_columns.index(feature)] = (lo, hi)
+    return box
+
+
+def purity_path(rules_path):
+    """Purity file written next to a rules file: certain_rules_purity.json."""
+    return f"{os.path.splitext(rules_path)[0]}_purity.json"
+
+
+def rule_purity(X, y, rules):
+    """
+    {rule: share of the rows of X matched by the rule whose label in y is
+    the rule's class}; 0.0 for a rule that matches no row.
+    """
+    labels = np.asarray(y).astype(str)
+    columns = {}
+    purity = {}
+    for rule in rules:
+        mask = rule_mask(X, rule, columns)
+        purity[rule] = float((labels[mask] == rule_label(rule)).mean()) if mask.any() else 0.0
+    return purity
+
+
+def save_purity(purity, rules_path):
+    with open(purity_path(rules_path), 'w') as f:
+        json.dump(purity, f, indent=1)
+
+
+def load_purity(rules_path):
+    """Recorded purity of the rules of `rules_path`, or {} if there is none."""
+    try:
+        with open(purity_path(rules_path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Warning: no rule purity in {purity_path(rules_path)} (run extract_rules.py); "
+              f"no rule of {rules_path} is used")
+        return {}
+
+
+class RuleFastPath:
+    """
+    `model` wrapped with a rule lookup; predict() has the same output as
+    model.predict (values of model.classes_) and classes_ is the model's.
+    """
+
+    def __init__(self, model, feature_columns, features, edges, tables, class_masks,
+                 n_rules, n_skipped):
+        self.model = model
+        self.feature_columns = list(feature_columns)
+        self.classes_ = model.classes_
+        self.features = features          # index des features utilisées par les règles
+        self.edges = edges                # seuils triés, par feature utilisée
+        self.tables = tables              # (bins, mots) uint64, par feature utilisée
+        self.class_masks = class_masks    # (classes, mots) uint64
+        self.n_rules = n_rules
+        self.n_skipped = n_skipped
+
+    @classmethod
+    def from_rules(cls, rules, model, feature_columns=FEATURE_COLUMNS, label_encoder=None,
+                   purity=None, min_purity=MIN_RULE_PURITY):
+        """
+        Compile rule strings for `model`. Rule classes are matched with
+        model.classes_ by name, or through `label_encoder` when the model
+        predicts encoded labels (simple_ids). Only the rules whose
+        `purity` ({rule: purity}, see rule_purity) is at least
+        `min_purity` are compiled.
+        """
+        purity = purity or {}
+        feature_columns = list(feature_columns)
+        class_index = {str(c): i for i, c in enumerate(model.classes_)}
+        if label_encoder is not None:
+            for code, name in enumerate(label_encoder.classes_):
+                if str(code) in class_index:
+                    class_index.setdefault(str(name), class_index[str(code)])
+
+        unique = list(dict.fromkeys(r.strip() for r in rules if r.strip()))
+        boxes, rule_class = [], []
+        for rule in unique:
+            if purity.get(rule, 0.0) < min_purity:
+                continue
+            predicates = parse_condition(rule_condition(rule))
+            label = class_index.get(rule_label(rule))
+            box = rule_box(predicates, feature_columns) if predicates else None
+            if box is None or label is None:
+                continue
+            boxes.append(box)
+            rule_class.append(label)
+
+        n_words = max(1, (len(boxes) + 63) // 64)
+        words = np.arange(len(boxes)) // 64
+        bits = np.left_shift(np.uint64(1), (np.arange(len(boxes)) % 64).astype(np.uint64))
+
+        class_masks = np.zeros((len(model.classes_), n_words), dtype=np.uint64)
+        for r, c in enumerate(rule_class):
+            class_masks[c, words[r]] |= bits[r]
+
+        features, edges, tables = [], [], []
+        for f in sorted({f for box in boxes for f in box}):
+            bounds = [b for box in boxes if f in box for b in box[f]]
+            f_edges = np.unique(np.asarray(bounds, dtype=np.float64))
+            f_edges = f_edges[np.isfinite(f_edges)]
+            # bin(x) = searchsorted(edges, x, 'left') : x <= edges[k] <=> bin <= k
+            table = np.zeros((len(f_edges) + 1, n_words), dtype=np.uint64)
+            for r, box in enumerate(boxes):
+                lo, hi = box.get(f, (-np.inf, np.inf))
+                first = 0 if lo == -np.inf else np.searchsorted(f_edges, lo) + 1
+                last = len(f_edges) if hi == np.inf else np.searchsorted(f_edges, hi)
+                table[first:last + 1, words[r]] |= bits[r]
+            features.append(f)
+            edges.append(f_edges)
+            tables.append(table)
+        return cls(model, feature_columns, features, edges, tables, class_masks,
+                   len(boxes), len(unique) - len(boxes))
+
+    @classmethod
+    def from_file(cls, path, model, feature_columns=FEATURE_COLUMNS, label_encoder=None,
+                  min_purity=MIN_RULE_PURITY):
+        """Compile the rules of `path`, gated by the purity recorded next to it."""
+        with open(path) as f:
+            rules = f.read().split('\n')
+        return cls.from_rules(rules, model, feature_columns, label_encoder,
+                              load_purity(path), min_purity)
+
+    def _array(self, X):
+        if hasattr(X, 'columns'):
+            X = X[self.feature_columns]
+        return np.asarray(X, dtype=np.float64)
+
+    def lookup(self, X, chunk_size=4096):
+        """
+        (covered, class index) per row: covered rows match rules of a
+        single class, given by model.classes_[class index].
+        """
+        X = self._array(X)
+        covered = np.zeros(len(X), dtype=bool)
+        label = np.zeros(len(X), dtype=np.intp)
+        if self.n_rules == 0:
+            return covered, label
+        # Par blocs de lignes pour borner la taille du tableau (lignes x mots)
+        for start in range(0, len(X), chunk_size):
+            chunk = X[start:start + chunk_size]
+            matched = np.full((len(chunk), self.class_masks.shape[1]),
+                              np.iinfo(np.uint64).max, dtype=np.uint64)
+            for f, f_edges, table in zip(self.features, self.edges, self.tables):
+                matched &= table[np.searchsorted(f_edges, chunk[:, f])]
+            has_class = np.stack([(matched & mask).any(axis=1) for mask in self.class_masks],
+                                 axis=1)
+            # Une ligne avec un NaN ne satisfait aucune comparaison des règles
+            ok = (has_class.sum(axis=1) == 1) & ~np.isnan(chunk).any(axis=1)
+            covered[start:start + len(chunk)] = ok
+            label[start:start + len(chunk)] = np.argmax(has_class, axis=1)
+        return covered, label
+
+    def predict(self, X):
+        covered, label = self.lookup(X)
+        predictions = np.asarray(self.classes_).take(label, axis=0)
+        if not covered.all():
+            rest = X[~covered]
+            predictions[~covered] = self.model.predict(rest)
+        return predictions
+
+
+def benchmark(fast, X, repeat=3):
+    """
+    Coverage of the rules on X, agreement with the forest on the covered
+    rows, and rows/sec of the forest alone vs rules + forest (best of
+    `repeat`). Returns the figures as a dict.
+    """
+    def best_time(predict):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = predict(X)
+            times.append(time.perf_counter() - start)
+        return result, min(times)
+
+    forest, forest_time = best_time(fast.model.predict)
+    two_tier, fast_time = best_time(fast.predict)
+    covered, _ = fast.lookup(X)
+
+    report = {
+        'rows': len(X),
+        'rules': fast.n_rules,
+        'skipped_rules': fast.n_skipped,
+        'coverage': float(covered.mean()) if len(X) else 0.0,
+        'agreement': float((two_tier[covered] == forest[covered]).mean()) if covered.any() else 1.0,
+        'forest_rows_per_sec': len(X) / forest_time if forest_time else 0.0,
+        'two_tier_rows_per_sec': len(X) / fast_time if fast_time else 0.0,
+    }
+    report['speedup'] = forest_time / fast_time if fast_time else 0.0
+    print(f"[*] {report['rules']} certain rules compiled ({report['skipped_rules']} skipped, "
+          f"including those below the purity threshold)")
+    print(f"[*] Coverage: {report['coverage']:.1%} of {report['rows']} rows answered by the rules")
+    print(f"[*] Agreement with the forest on covered rows: {report['agreement']:.2%}")
+    print(f"[*] Forest only: {report['forest_rows_per_sec']:.0f} rows/sec, "
+          f"rules + forest: {report['two_tier_rows_per_sec']:.0f} rows/sec "
+          f"(x{report['speedup']:.2f})")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Certain-rule fast path in front of a RandomForest")
+    parser.add_argument("model", nargs="?", default="corrected_rf_model.pkl")
+    parser.add_argument("rules", nargs="?", default="certain_rules.txt")
+    parser.add_argument("--encoder", help="label encoder, if the model predicts encoded labels")
+    parser.add_argument("--data", default="output_features.csv")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-purity", type=float, default=MIN_RULE_PURITY,
+                        help="minimum recorded purity of a compiled rule")
+    args = parser.parse_args()
+
+    encoder = joblib.load(args.encoder) if args.encoder else None
+    fast = RuleFastPath.from_file(args.rules, joblib.load(args.model), FEATURE_COLUMNS, encoder,
+                                  args.min_purity)
+    benchmark(fast, load_dataset(args.data, FEATURE_COLUMNS, target=None, use_cache=False),
+              args.repeat)
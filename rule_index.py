@@ -0,0 +1,120 @@
+import mmap
+import struct
+
+import numpy as np
+
+# En-tête du fichier d'index : magic, nombre de règles, largeur des clés,
+# version du jeu de règles
+_MAGIC = b'RULEIDX2'
+_HEADER = struct.Struct('<8sQQ16s')
+
+
+def _successor(prefix):
+    """Smallest bytes string above every string starting with `prefix`, or None."""
+    prefix = prefix.rstrip(b'\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class RuleIndex:
+    """
+    Prefix index over a list of rule strings.
+
+    The rules are kept sorted, so every rule starting with a given prefix
+    lives in one contiguous range found by binary search. A lookup costs
+    O(log C + k) for k matches instead of a startswith() test against
+    each of the C rules.
+
+    The sorted rules are a fixed-width NumPy bytes array ('S<width>',
+    zero-padded UTF-8; rules never contain NUL), searched in C with
+    searchsorted without copying any key, plus two int64 arrays: the
+    original position of each sorted rule and the sorted rank of each
+    original rule. The three arrays can be saved to a file and
+    memory-mapped read-only by several worker processes that then share
+    one copy of them in RAM (see save() / load()). The index also
+    behaves as a read-only sequence of the rules in their original order.
+    """
+
+    def __init__(self, rules, version=''):
+        encoded = [r.encode('utf-8') for r in rules]
+        width = max(1, max(map(len, encoded), default=0))
+        # L'ordre des octets UTF-8 est celui des points de code : même tri que str
+        order = np.asarray(sorted(range(len(encoded)), key=encoded.__getitem__),
+                           dtype=np.int64)
+        keys = np.array(encoded, dtype=f'S{width}')[order] if encoded \
+            else np.empty(0, dtype=f'S{width}')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        self._init(keys, order, rank, version)
+
+    def _init(self, keys, order, rank, version):
+        self._keys = keys
+        self._order = order
+        self._rank = rank
+        self.version = version
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("rule index out of range")
+        return self._keys[self._rank[i]].decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _range(self, prefix):
+        """[start, end) of the sorted rules starting with `prefix`."""
+        prefix = prefix.encode('utf-8')
+        start = int(self._keys.searchsorted(prefix))
+        # Les règles commençant par prefix sont entre prefix et son successeur
+        end = _successor(prefix)
+        end = len(self._keys) if end is None else int(self._keys.searchsorted(end))
+        return start, end
+
+    def match(self, prefix):
+        """
+        Rules starting with `prefix`, duplicates included, in the order
+        they appear in the original list (same result as
+        [r for r in rules if r.startswith(prefix)]).
+        """
+        start, end = self._range(prefix)
+        if end - start == 1:
+            return [self._keys[start].decode('utf-8')]
+        found = self._keys[start:end][np.argsort(self._order[start:end], kind='stable')]
+        return [k.decode('utf-8') for k in found.tolist()]
+
+    def save(self, path):
+        """Write the index to `path` in the flat format read by load()."""
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(self), self._keys.dtype.itemsize,
+                                 self.version.encode('ascii')))
+            f.write(self._order.tobytes())
+            f.write(self._rank.tobytes())
+            f.write(self._keys.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map an index written by save(). Nothing is copied: every
+        process mapping the same file shares its pages.
+        """
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, width, version = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a rule index file")
+        start = _HEADER.size
+        order = np.frombuffer(mm, dtype=np.int64, count=count, offset=start)
+        start += 8 * count
+        rank = np.frombuffer(mm, dtype=np.int64, count=count, offset=start)
+        start += 8 * count
+        keys = np.frombuffer(mm, dtype=f'S{width}', count=count, offset=start)
+        index = cls.__new__(cls)
+        index._init(keys, order, rank, version.rstrip(b'\0').decode('ascii'))
+        return index
@@ -0,0 +1,138 @@
+"""
+Delta-sync protocol between the clients and the server (POST /sync_rules).
+
+Instead of posting every uncertain rule as text each round (/correct_rules),
+a client keeps a local cache of what it already knows:
+
+  - the corrected matches of each uncertain rule it has synced, keyed by a
+    compact rule hash (rule_hash, 16 hex characters);
+  - a copy of the server's accumulated corrected-rule store;
+  - the version it last saw, "<rules version>:<store size>".
+
+Each round it sends only the hashes of the uncertain rules missing from its
+cache, plus its version. The server answers with:
+
+  version               the new version
+  reset                 true if the client's version is unusable (the
+                        server's rule set changed): caches must be dropped
+  matches               {hash: [corrected rules]} for the hashes it knows
+  unknown               hashes it has never seen, to be sent again as text
+  new_corrected_rules   the store entries added since the client's version
+
+Unknown hashes are then sent as text ("uncertain_rules") in a second
+request. Hash -> matches results are shared by all clients on the server,
+so a rule another client already sent never travels as text again.
+Bandwidth and server work per round depend on the new rules only.
+"""
+import hashlib
+import json
+import os
+
+import requests
+
+
+def rule_hash(rule):
+    """Compact hash of a rule string used as its key in the protocol."""
+    return hashlib.blake2b(rule.strip().encode('utf-8'), digest_size=8).hexdigest()
+
+
+def format_version(rules_version, num_stored):
+    return f"{rules_version}:{num_stored}"
+
+
+def parse_version(version):
+    """(rules version, store size) of a version string; (None, 0) if unusable."""
+    if not isinstance(version, str):
+        return None, 0
+    rules_version, _, num_stored = version.rpartition(':')
+    try:
+        return rules_version, int(num_stored)
+    except ValueError:
+        return None, 0
+
+
+class SyncClient:
+    """
+    Client side of /sync_rules, with its cache persisted in `cache_path`.
+
+        client = SyncClient('http://localhost:5000/sync_rules')
+        corrected, all_corrected, num_stored = client.sync(uncertain_rules)
+    """
+
+    def __init__(self, url, cache_path='rule_sync_cache.json', session=None):
+        self.url = url
+        self.cache_path = cache_path
+        self.session = session or requests.Session()
+        self.version = None
+        self.matches = {}
+        self.store = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._load()
+
+    def _load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if cache.get('url') != self.url:
+            return
+        self.version = cache.get('version')
+        self.matches = cache.get('matches', {})
+        self.store = cache.get('store', [])
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': self.url, 'version': self.version,
+                       'matches': self.matches, 'store': self.store}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _post(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        resp = self.session.post(self.url, data=body,
+                                 headers={'Content-Type': 'application/json'})
+        resp.raise_for_status()
+        self.bytes_sent += len(body)
+        self.bytes_received += len(resp.content)
+        data = resp.json()
+        if data.get('reset'):
+            self.matches = {}
+            self.store = []
+        self.store.extend(data.get('new_corrected_rules', []))
+        self.matches.update(data.get('matches', {}))
+        self.version = data.get('version')
+        return data
+
+    def sync(self, uncertain_rules):
+        """
+        Corrected rules for `uncertain_rules` (in order), the accumulated
+        store of corrected rules and its size, like /correct_rules returns
+        in corrected_rules, all_corrected_rules and num_stored.
+        """
+        by_hash = {}
+        for rule in uncertain_rules:
+            by_hash.setdefault(rule_hash(rule), rule)
+
+        def missing():
+            return [h for h in by_hash if h not in self.matches]
+
+        data = self._post({'since': self.version, 'uncertain_hashes': missing()})
+        if data.get('reset'):
+            # Caches vidés : on redemande toutes les règles de ce tour
+            data = self._post({'since': self.version, 'uncertain_hashes': missing()})
+        unknown = missing()
+        if unknown:
+            self._post({'since': self.version,
+                        'uncertain_rules': [by_hash[h] for h in unknown]})
+
+        # Le cache ne garde que les règles incertaines du tour courant
+        self.matches = {h: self.matches.get(h, []) for h in by_hash}
+        self._save()
+        corrected = [r for h in by_hash for r in self.matches[h]]
+        return corrected, list(self.store), len(self.store)
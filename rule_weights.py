@@ -0,0 +1,162 @@
+import ast
+import operator
+
+import numpy as np
+
+# Opérateurs de comparaison acceptés dans une condition "if ... then ..."
+OP_SYMBOLS = {
+    ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+    ast.Eq: '==', ast.NotEq: '!=',
+}
+
+
+def rule_condition(rule):
+    """
+    Return the condition part of a rule string, exactly as the clients
+    extracted it before evaluating it: everything before " then",
+    without the "if " keyword.
+    """
+    return rule.split(" then")[0].replace("if ", "")
+
+
+def _literal(node):
+    """Return the numeric value of a constant node, or None."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _literal(node.operand)
+        if value is None:
+            return None
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    return None
+
+
+def _compare_predicates(node):
+    """
+    Turn a (possibly chained) comparison "a op1 b op2 c" into a list of
+    (feature, operator, threshold) triples, or None if it is not made
+    only of feature names and numeric constants.
+    """
+    operands = [node.left] + list(node.comparators)
+    predicates = []
+    for op, left, right in zip(node.ops, operands, operands[1:]):
+        if type(op) not in OP_SYMBOLS:
+            return None
+        if isinstance(left, ast.Name) and _literal(right) is not None:
+            predicates.append((left.id, OP_SYMBOLS[type(op)], _literal(right)))
+        elif isinstance(right, ast.Name) and _literal(left) is not None:
+            # "28.5 >= src_bytes" -> "src_bytes <= 28.5"
+            flipped = {'<': '>', '<=': '>=', '>': '<', '>=': '<=',
+                       '==': '==', '!=': '!='}[OP_SYMBOLS[type(op)]]
+            predicates.append((right.id, flipped, _literal(left)))
+        else:
+            return None
+    return predicates
+
+
+def parse_condition(cond):
+    """
+    Parse a condition string once into a structured predicate list.
+
+    Returns:
+      - a list of (feature, operator, threshold) triples whose
+        conjunction is the condition;
+      - [] if the condition can never match (it is not valid Python,
+        so the old eval() always raised and the rule was skipped);
+      - None if the condition is valid but outside the supported
+        grammar; the caller then falls back to eval().
+    """
+    try:
+        tree = ast.parse(cond.strip(), mode='eval')
+    except SyntaxError:
+        return []
+
+    body = tree.body
+    if isinstance(body, ast.BoolOp) and isinstance(body.op, ast.And):
+        terms = body.values
+    else:
+        terms = [body]
+
+    predicates = []
+    for term in terms:
+        if not isinstance(term, ast.Compare):
+            return None
+        parsed = _compare_predicates(term)
+        if parsed is None:
+            return None
+        predicates.extend(parsed)
+    return predicates
+
+
+OP_FUNCS = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt,
+    '>=': operator.ge, '==': operator.eq, '!=': operator.ne,
+}
+
+
+def _eval_mask(X, cond):
+    """Fallback for conditions outside the grammar: per-row eval()."""
+    mask = np.zeros(len(X), dtype=bool)
+    for i, row in enumerate(X.to_dict('records')):
+        try:
+            if eval(cond, {}, row):
+                mask[i] = True
+        except Exception:
+            pass
+    return mask
+
+
+def rule_mask(X, rule, columns=None):
+    """
+    Boolean mask of the rows of the DataFrame X matched by `rule`.
+    `columns` is an optional cache {feature: numpy array}.
+    """
+    if columns is None:
+        columns = {}
+    cond = rule_condition(rule)
+    predicates = parse_condition(cond)
+    if predicates is None:
+        return _eval_mask(X, cond)
+    if not predicates:
+        return np.zeros(len(X), dtype=bool)
+
+    mask = np.ones(len(X), dtype=bool)
+    for feature, op, threshold in predicates:
+        if feature not in X.columns:
+            # eval() aurait levé NameError : la règle ne matche jamais
+            return np.zeros(len(X), dtype=bool)
+        if feature not in columns:
+            # Comparaison en float64, quel que soit le type des colonnes
+            columns[feature] = X[feature].to_numpy(dtype=np.float64)
+        mask &= OP_FUNCS[op](columns[feature], threshold)
+    return mask
+
+
+def compute_sample_weights(X, rules, factor=1.5):
+    """
+    Vectorized replacement for the per-row eval() loop of the clients.
+
+    Each rule condition is parsed once and evaluated as a boolean mask
+    over the column arrays of X. Every row matched by a rule has its
+    weight multiplied by `factor`, so weights compound per matching
+    rule. The result is positional: weights[i] belongs to X.iloc[i].
+    """
+    columns = {}
+    weights = np.ones(len(X), dtype=float)
+    for rule in rules:
+        weights[rule_mask(X, rule, columns)] *= factor
+    return weights
+
+
+def rule_match_counts(X, rules):
+    """
+    Number of rules matching each row of X (positional). Since weights
+    compound per matching rule, compute_sample_weights(X, rules, f) is
+    f ** rule_match_counts(X, rules), so the counts can be computed once
+    and reused for several factors.
+    """
+    columns = {}
+    counts = np.zeros(len(X), dtype=np.int64)
+    for rule in rules:
+        counts += rule_mask(X, rule, columns)
+    return counts
@@ -1,21 +1,22 @@
 
-from flask import Flask, request, jsonify
-from web3 import Web3
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-app = Flask(__name__)
-
-# --- Web3 + Contract Setup ---
-ganache_url = "http://127.0.0.1:8545"  # adjust if your Ganache is on a different port
-web3 = Web3(Web3.HTTPProvider(ganache_url))
+from flask import Flask, Response, g, request, jsonify
 
-if not web3.is_connected():
-    raise Exception(f"Cannot connect to Ganache at {ganache_url}")
+import chain_backend
+import merkle_anchor
+import metrics
+import rule_sync
+import wire
+from corrected_store import CorrectedRuleStore
+from lru_cache import LRUCache
+from rule_index import RuleIndex
 
-accounts = web3.eth.accounts
-if not accounts:
-    raise Exception("No accounts found on the node; is Ganache running?")
-
-web3.eth.default_account = accounts[0]
+app = Flask(__name__)
 
 # ── Paste your contract's ABI here ────────────────────────────────────────────────
 abi = [
@@ -147,60 +148,395 @@ abi = [
 # ──────────────────────────────────────────────────────────────────────────────
 
 # ── Replace this with your deployed contract address ────────────────────────────
-contract_address = "0x7869ECEdf65c7670D95225A927AA9B2dd7013c71"
+contract_address = os.environ.get("RULES_CONTRACT_ADDRESS",
+                                  "0x7869ECEdf65c7670D95225A927AA9B2dd7013c71")
 # ──────────────────────────────────────────────────────────────────────────────
 
-contract = web3.eth.contract(address=contract_address, abi=abi)
+# --- Web3 + Contract Setup ---
+# Ganache by default (CHAIN_URL to change it); CHAIN_BACKEND=memory or
+# sqlite:<path> runs against the simulated chain of chain_backend.py
+web3, contract = chain_backend.connect(contract_address, abi)
+accounts = web3.eth.accounts
+
+
+# ── Métriques Prometheus (GET /metrics) ───────────────────────────────────────
+METRICS = metrics.Registry()
+# Plusieurs workers (gunicorn_conf.py) : métriques agrégées via ce répertoire
+if os.environ.get("METRICS_DIR"):
+    METRICS.enable_multiprocess(os.environ["METRICS_DIR"])
+HTTP_REQUESTS = metrics.Counter(
+    'http_requests_total', 'HTTP requests by route, method and status.',
+    ('route', 'method', 'status'), registry=METRICS)
+HTTP_LATENCY = metrics.Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route.',
+    ('route',), registry=METRICS)
+PAYLOAD_RULES = metrics.Histogram(
+    'correct_rules_payload_rules', 'Rules per /correct_rules call: uncertain in, corrected out.',
+    ('direction',), buckets=metrics.SIZE_BUCKETS, registry=METRICS)
+STAGE_LATENCY = metrics.Histogram(
+    'correct_rules_stage_seconds', 'Time spent per /correct_rules stage (decode, match, store, serialize).',
+    ('stage',), registry=METRICS)
+RESPONSE_CACHE_LOOKUPS = metrics.Counter(
+    'correct_rules_cache_total', 'Response cache lookups by result.',
+    ('result',), registry=METRICS)
+RULES_LOADED = metrics.Gauge(
+    'continuous_rules', 'Continuous rules currently loaded.', registry=METRICS)
+CORRECTED_STORED = metrics.Gauge(
+    'corrected_rules_stored', 'Corrected rules in the accumulated store.', registry=METRICS)
+RULES_LOAD_SECONDS = metrics.Gauge(
+    'continuous_rules_load_seconds', 'Duration of the startup rule load from chain.',
+    registry=METRICS)
+CHAIN_RPC_CALLS = metrics.Counter(
+    'chain_rpc_calls_total', 'Contract calls by function and outcome.',
+    ('function', 'outcome'), registry=METRICS)
+CHAIN_RPC_LATENCY = metrics.Histogram(
+    'chain_rpc_duration_seconds', 'Contract call latency by function.',
+    ('function',), registry=METRICS)
+
+
+def chain_call(function, *args):
+    """contract.functions.<function>(*args).call(), counted and timed."""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        result = getattr(contract.functions, function)(*args).call()
+        outcome = 'ok'
+        return result
+    finally:
+        CHAIN_RPC_LATENCY.observe(time.perf_counter() - start, function=function)
+        CHAIN_RPC_CALLS.inc(function=function, outcome=outcome)
+
+
+# ── Chargement des règles : pool de requêtes concurrentes + snapshot local ─────
+FETCH_WORKERS = int(os.environ.get("RULES_FETCH_WORKERS", "32"))
+SNAPSHOT_PATH = f"rules_snapshot_{contract_address}.json"
+# RULES_FORCE_RESYNC=1 ignore le snapshot et relit toute la chaîne
+FORCE_RESYNC = os.environ.get("RULES_FORCE_RESYNC", "0") == "1"
+
+
+def load_rules_snapshot(path=SNAPSHOT_PATH):
+    """
+    Return the raw per-index rule list saved for this contract, or [] if
+    there is no usable snapshot. Entries that could not be fetched last
+    time are stored as None.
+    """
+    try:
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+    if snapshot.get('contract') != contract_address:
+        return []
+    raw = snapshot.get('rules', [])
+    if snapshot.get('count') != len(raw):
+        return []
+    return raw
+
 
+def save_rules_snapshot(raw, path=SNAPSHOT_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'contract': contract_address, 'count': len(raw),
+                   'rules': raw}, f)
+    os.replace(tmp_path, path)
 
-def load_continuous_rules_from_chain():
+
+def _fetch_rule(i):
+    try:
+        return i, chain_call('getRule', i)
+    except Exception as e:
+        # If a call fails, skip that index; it is retried on the next start
+        print(f"Warning: could not fetch rule {i}: {e}")
+        return i, None
+
+
+def load_continuous_rules_from_chain(force_resync=FORCE_RESYNC,
+                                     workers=FETCH_WORKERS):
     """
     Fetch all rules stored in the RandomForestRules contract.
     Returns a Python list of strings.
+
+    Indices already present in the local snapshot are not fetched again;
+    the others are read with up to `workers` concurrent getRule calls.
+    `force_resync` ignores the snapshot and re-reads the whole chain.
     """
-    rules = []
     try:
-        total_count = contract.functions.getRuleCount().call()
+        total_count = chain_call('getRuleCount')
     except Exception as e:
         raise Exception(f"Error reading rule count from chain: {e}")
 
-    for i in range(total_count):
-        try:
-            rule_str = contract.functions.getRule(i).call()
-        except Exception as e:
-            # If a call fails, skip that index (or choose to abort)
-            print(f"Warning: could not fetch rule {i}: {e}")
-            continue
-        # Only append non-empty rules
-        if rule_str and rule_str.strip():
-            rules.append(rule_str.strip())
+    raw = [] if force_resync else load_rules_snapshot()
+    if len(raw) > total_count:
+        # Le contrat a moins de règles que le snapshot : chaîne réinitialisée
+        raw = []
+    raw = raw + [None] * (total_count - len(raw))
+
+    missing = [i for i, rule_str in enumerate(raw) if rule_str is None]
+    from_snapshot = total_count - len(missing)
+    start = time.perf_counter()
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for i, rule_str in pool.map(_fetch_rule, missing):
+                raw[i] = rule_str
+        save_rules_snapshot(raw)
+    fetched = sum(1 for i in missing if raw[i] is not None)
+    print(f"Règles : {from_snapshot} depuis le snapshot, {fetched} depuis la "
+          f"blockchain ({time.perf_counter() - start:.2f}s)")
+
+    # Only keep non-empty rules
+    return expand_anchored_rules([r.strip() for r in raw if r and r.strip()])
 
+
+# Lots de règles ancrés par leur racine de Merkle (uploadrules.py --anchor)
+BLOB_STORE = merkle_anchor.BlobStore(os.environ.get("RULE_BLOB_DIR", merkle_anchor.BLOB_DIR))
+
+
+def expand_anchored_rules(entries):
+    """
+    Replace each Merkle anchor among the on-chain entries by the rules of
+    its batch, read from the local blob store and verified against the
+    on-chain root. Batches that are missing or fail verification are
+    skipped with a warning, so no unverified rule is ever loaded.
+    """
+    rules = []
+    for entry in entries:
+        if not merkle_anchor.is_anchor(entry):
+            rules.append(entry)
+            continue
+        try:
+            rules.extend(merkle_anchor.resolve_anchor(entry, BLOB_STORE))
+        except (KeyError, ValueError) as e:
+            print(f"Warning: skipping anchored batch: {e}")
     return rules
 
 
+# Mode production (gunicorn_conf.py) : l'index est écrit dans ce fichier puis
+# mappé en mémoire, partagé en lecture seule par tous les workers
+RULE_INDEX_FILE = os.environ.get("RULE_INDEX_FILE")
+
+
+def build_rule_index(rules, version, path=RULE_INDEX_FILE):
+    """
+    Build the prefix index of `rules`. When `path` is set, the index is
+    written there and memory-mapped, so that worker processes forked
+    after loading share a single read-only copy of it.
+    """
+    index = RuleIndex(rules, version)
+    if not path:
+        return index
+    tmp_path = path + '.tmp'
+    index.save(tmp_path)
+    os.replace(tmp_path, path)
+    return RuleIndex.load(path)
+
+
 # Load once at startup
-CONTINUOUS_RULES = load_continuous_rules_from_chain()
+_load_start = time.perf_counter()
+_rules = load_continuous_rules_from_chain()
+# Version du jeu de règles : change dès que CONTINUOUS_RULES change,
+# ce qui invalide les réponses mises en cache
+RULES_VERSION = hashlib.sha256("\n".join(_rules).encode('utf-8')).hexdigest()[:16]
+RULE_INDEX = build_rule_index(_rules, RULES_VERSION)
+# L'index est aussi une séquence des règles (dans l'ordre de la chaîne) :
+# on ne garde pas de seconde copie sous forme de liste
+CONTINUOUS_RULES = RULE_INDEX
+del _rules
+RULES_LOAD_SECONDS.set(time.perf_counter() - _load_start)
+RULES_LOADED.set(len(CONTINUOUS_RULES))
 print(f"{len(CONTINUOUS_RULES)} règles continues chargées depuis la blockchain")
 
+# Règles corrigées déjà calculées, par hash de la requête
+MATCH_CACHE = LRUCache(maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", "256")))
+# Réponses déjà encodées, par (état du store, hash de la requête, format de réponse)
+RESPONSE_CACHE = LRUCache(maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", "256")))
+
+# /sync_rules : règles corrigées de chaque règle incertaine déjà reçue, par
+# (version des règles, hash de la règle), partagées entre tous les clients
+SYNC_MATCHES = LRUCache(maxsize=int(os.environ.get("SYNC_CACHE_SIZE", "1000000")))
+
+# Règles corrigées accumulées sur tous les clients : journal en ajout seul,
+# rejoué au démarrage et partagé entre les workers gunicorn
+CORRECTED_RULES_LOG = os.environ.get("CORRECTED_RULES_LOG",
+                                     f"corrected_rules_{contract_address}.log")
+CORRECTED_STORE = CorrectedRuleStore(CORRECTED_RULES_LOG)
+CORRECTED_STORED.set(len(CORRECTED_STORE))
+print(f"{len(CORRECTED_STORE)} règles corrigées rejouées depuis {CORRECTED_RULES_LOG}")
+
+
+def match_uncertain_rules(uncertain_rules):
+    """Continuous rules starting with the condition of each uncertain rule."""
+    corrected = []
+    for ur in uncertain_rules:
+        # Extract the "condition" part (everything before " then", if present)
+        cond_ur = ur.split(" then")[0].strip()
+        corrected.extend(RULE_INDEX.match(cond_ur))
+    return corrected
+
+
+def string_list(data, key):
+    """data[key] (default []), checked to be a list of strings; raises ValueError."""
+    value = data.get(key, [])
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f'"{key}" must be a list of strings')
+    return value
+
 
 @app.route('/correct_rules', methods=['POST'])
 def correct_rules():
     """
-    Expects JSON body with key "uncertain_rules": a list of rule‐strings.
-    Returns JSON with "corrected_rules": a list of matching continuous rules.
+    Expects a body with key "uncertain_rules": a list of rule‐strings.
+    Returns "corrected_rules": a list of matching continuous rules, which
+    are added to the global store of corrected rules, "all_corrected_rules":
+    the content of that store (accumulated over all clients, in insertion
+    order), and "num_stored": its size.
+
+    Bodies may be JSON or msgpack (Content-Type: application/x-msgpack)
+    and gzip-compressed (Content-Encoding: gzip). The response uses
+    msgpack and/or gzip when the Accept / Accept-Encoding headers ask
+    for them. Identical requests against the same rule-set version are
+    answered from an LRU cache while the store does not change, and
+    carry an ETag so clients can revalidate with If-None-Match.
     """
-    data = request.get_json() or {}
-    uncertain_rules = data.get('uncertain_rules', [])
-    corrected = []
+    try:
+        raw = wire.read_body(request)
+        data = wire.decode_body(raw, request.mimetype) or {}
+        if not isinstance(data, dict):
+            raise ValueError("request body must be an object")
+        uncertain_rules = string_list(data, 'uncertain_rules')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    STAGE_LATENCY.observe(time.perf_counter() - g.request_start, stage='decode')
 
-    for ur in uncertain_rules:
-        # Extract the "condition" part (everything before " then", if present)
-        cond_ur = ur.split(" then")[0].strip()
-        for cr in CONTINUOUS_RULES:
-            if cr.startswith(cond_ur):
-                corrected.append(cr)
+    request_hash = hashlib.sha256(raw).hexdigest()
+    corrected = MATCH_CACHE.get((RULES_VERSION, request_hash))
+    if corrected is None:
+        with STAGE_LATENCY.time(stage='match'):
+            corrected = match_uncertain_rules(uncertain_rules)
+        MATCH_CACHE.put((RULES_VERSION, request_hash), corrected)
+    # Tailles observées pour chaque requête, servie par le cache ou non
+    PAYLOAD_RULES.observe(len(uncertain_rules), direction='in')
+    PAYLOAD_RULES.observe(len(corrected), direction='out')
 
-    return jsonify({"corrected_rules": corrected})
+    with STAGE_LATENCY.time(stage='store'):
+        num_stored = CORRECTED_STORE.add(corrected)
+    CORRECTED_STORED.set(num_stored)
+
+    # Le store ne fait que grandir : sa taille suffit à versionner la réponse
+    etag = f"{RULES_VERSION}-{num_stored}-{request_hash[:32]}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    mimetype, use_gzip = wire.response_format(request)
+    cache_key = (RULES_VERSION, num_stored, request_hash, mimetype, use_gzip)
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is None:
+        RESPONSE_CACHE_LOOKUPS.inc(result='miss')
+        with STAGE_LATENCY.time(stage='serialize'):
+            cached = wire.encode_body({
+                "corrected_rules": corrected,
+                "all_corrected_rules": CORRECTED_STORE.rules(num_stored),
+                "num_stored": num_stored,
+            }, mimetype, use_gzip)
+        RESPONSE_CACHE.put(cache_key, cached)
+    else:
+        RESPONSE_CACHE_LOOKUPS.inc(result='hit')
+    body, content_encoding = cached
+
+    response = Response(body, mimetype=mimetype)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    response.set_etag(etag, weak=True)
+    return response
+
+
+@app.route('/sync_rules', methods=['POST'])
+def sync_rules():
+    """
+    Delta-sync variant of /correct_rules (protocol in rule_sync.py).
+
+    Expects "since" (the last version the client saw), "uncertain_hashes"
+    (rule_hash of uncertain rules it has no matches for) and/or
+    "uncertain_rules" (the text of hashes reported unknown). Returns
+    "version", "reset", "matches" {hash: [corrected rules]}, "unknown"
+    and "new_corrected_rules", the store entries added since "since".
+    Matched rules are added to the store like in /correct_rules.
+    """
+    try:
+        data = wire.decode_body(wire.read_body(request), request.mimetype) or {}
+        if not isinstance(data, dict):
+            raise ValueError("request body must be an object")
+        hashes = string_list(data, 'uncertain_hashes')
+        uncertain_rules = string_list(data, 'uncertain_rules')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    STAGE_LATENCY.observe(time.perf_counter() - g.request_start, stage='decode')
+
+    client_rules_version, since = rule_sync.parse_version(data.get('since'))
+    num_stored = CORRECTED_STORE.refresh()
+    # Autre jeu de règles, ou store plus court que ce que le client a vu
+    reset = client_rules_version != RULES_VERSION or since > num_stored
+    if reset:
+        since = 0
+
+    matches, unknown = {}, []
+    with STAGE_LATENCY.time(stage='match'):
+        for h in hashes:
+            found = SYNC_MATCHES.get((RULES_VERSION, h))
+            if found is None:
+                unknown.append(h)
+            else:
+                matches[h] = found
+        for rule in uncertain_rules:
+            h = rule_sync.rule_hash(rule)
+            matches[h] = match_uncertain_rules([rule])
+            SYNC_MATCHES.put((RULES_VERSION, h), matches[h])
+    PAYLOAD_RULES.observe(len(hashes) + len(uncertain_rules), direction='in')
+
+    new = [r for found in matches.values() for r in found]
+    PAYLOAD_RULES.observe(len(new), direction='out')
+    with STAGE_LATENCY.time(stage='store'):
+        num_stored = CORRECTED_STORE.add(new)
+    CORRECTED_STORED.set(num_stored)
+
+    mimetype, use_gzip = wire.response_format(request)
+    with STAGE_LATENCY.time(stage='serialize'):
+        body, content_encoding = wire.encode_body({
+            "version": rule_sync.format_version(RULES_VERSION, num_stored),
+            "reset": reset,
+            "matches": matches,
+            "unknown": unknown,
+            "new_corrected_rules": CORRECTED_STORE.rules(num_stored, start=since),
+        }, mimetype, use_gzip)
+    response = Response(body, mimetype=mimetype)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    HTTP_LATENCY.observe(time.perf_counter() - g.request_start, route=route)
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus text exposition of the metrics: this process's, or those
+    of every worker summed when METRICS_DIR is set (see metrics.py).
+    """
+    return Response(METRICS.render(), content_type=metrics.Registry.CONTENT_TYPE)
 
 
 if __name__ == '__main__':
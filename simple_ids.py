@@ -1,8 +1,19 @@
-import pandas as pd
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import joblib
+import sklearn
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 
+from dataset import load_dataset
+from flat_forest import FlatForest
+
 # Define the only features to use
 FEATURE_COLUMNS = [
     'src_bytes', 'dst_bytes', 'rerror_rate', 'dst_host_count',
@@ -16,17 +27,16 @@ FEATURE_COLUMNS = [
 NSLKDD_FILE = "kdd_processed.csv"             # Your labeled dataset
 UNLABELED_FILE = "output_features.csv"  # Extracted features to classify
 
-def load_nslkdd_dataset(filepath):
-    df = pd.read_csv(filepath)
-
-    # Check if label exists
-    if 'labels' not in df.columns:
-        raise ValueError("Missing 'label' column in NSL-KDD dataset")
+# Trained models are cached under a key derived from the dataset content
+# and the hyperparameters below, and reused as long as neither changes
+MODEL_CACHE_DIR = "model_cache"
+MODEL_PARAMS = {'n_estimators': 100, 'random_state': 42}
 
-    # Keep only the selected features and the label
-    missing = [col for col in FEATURE_COLUMNS if col not in df.columns]
-    if missing:
-        raise ValueError(f"NSL-KDD dataset is missing columns: {missing}")
+def load_nslkdd_dataset(filepath):
+    # Keep only the selected features and the label (raises ValueError if
+    # any is missing); repeat runs read the columnar cache in dataset_cache/
+    # (DATASET_CACHE_DIR, see dataset.py)
+    df = load_dataset(filepath, FEATURE_COLUMNS, 'labels')
 
     X = df[FEATURE_COLUMNS]
     y = df['labels']
@@ -37,31 +47,96 @@ def load_nslkdd_dataset(filepath):
 
     return X, y_encoded, label_encoder
 
-def train_model(X, y):
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
+def train_model(X, y, params=MODEL_PARAMS):
+    # n_jobs does not change the fitted trees, only how fast they are built
+    model = RandomForestClassifier(**params, n_jobs=-1)
     model.fit(X, y)
     return model
 
-def load_unlabeled_data(filepath):
-    df = pd.read_csv(filepath)
-
-    # Ensure the unlabeled data has only the expected features
-    missing = [col for col in FEATURE_COLUMNS if col not in df.columns]
-    if missing:
-        raise ValueError(f"Unlabeled dataset is missing columns: {missing}")
-
-    return df[FEATURE_COLUMNS]
+def file_sha256(filepath, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def model_cache_dir(filepath, params=MODEL_PARAMS):
+    """
+    Cache directory of the model trained on `filepath` with `params`.
+    The sklearn and joblib versions are part of the key: pickles are not
+    portable across them, so an upgrade retrains instead of loading one.
+    """
+    key = hashlib.sha256(json.dumps({
+        'dataset': file_sha256(filepath),
+        'features': FEATURE_COLUMNS,
+        'params': params,
+        'sklearn': sklearn.__version__,
+        'joblib': joblib.__version__,
+    }, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(MODEL_CACHE_DIR, key)
+
+def load_or_train_model(filepath=NSLKDD_FILE, params=MODEL_PARAMS):
+    """
+    Return (model, label_encoder, cache_dir), training and caching the
+    model only if no artifact exists yet for this dataset content and
+    these hyperparameters. The cache directory holds model.joblib,
+    label_encoder.joblib and flat/, the forest exported as .npy node
+    arrays that scoring processes memory-map and share.
+    """
+    cache_dir = model_cache_dir(filepath, params)
+    model_path = os.path.join(cache_dir, "model.joblib")
+    encoder_path = os.path.join(cache_dir, "label_encoder.joblib")
+
+    def is_cached():
+        return os.path.exists(model_path) and os.path.exists(encoder_path)
+
+    if is_cached():
+        print(f"[*] Using cached model {cache_dir}")
+        return joblib.load(model_path), joblib.load(encoder_path), cache_dir
+
+    print("[*] Loading NSL-KDD dataset...")
+    X_train, y_train, label_encoder = load_nslkdd_dataset(filepath)
+    print("[*] Training Random Forest model...")
+    model = train_model(X_train, y_train, params)
+
+    # Répertoire temporaire propre au processus : deux premiers lancements
+    # simultanés n'écrivent pas dans le même
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".", suffix=".tmp",
+                               dir=MODEL_CACHE_DIR)
+    os.chmod(tmp_dir, 0o755)  # mkdtemp crée le répertoire en 0700
+    joblib.dump(model, os.path.join(tmp_dir, "model.joblib"))
+    joblib.dump(label_encoder, os.path.join(tmp_dir, "label_encoder.joblib"))
+    FlatForest.from_sklearn(model).save_arrays(os.path.join(tmp_dir, "flat"))
+    if os.path.exists(cache_dir) and not is_cached():
+        shutil.rmtree(cache_dir, ignore_errors=True)  # incomplete artifact from an interrupted run
+    try:
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # Un autre processus a publié le même modèle entre-temps
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"[*] Model cached in {cache_dir}")
+    return model, label_encoder, cache_dir
 
-def main():
-    print("[*] Loading and training on NSL-KDD dataset...")
-    X_train, y_train, label_encoder = load_nslkdd_dataset(NSLKDD_FILE)
+def load_unlabeled_data(filepath):
+    # Ensure the unlabeled data has only the expected features; captures
+    # are read once per run, so no columnar cache copy of them is written
+    return load_dataset(filepath, FEATURE_COLUMNS, target=None, use_cache=False)
 
-    print("[*] Training Random Forest model...")
-    model = train_model(X_train, y_train)
+def main(rules_path=None, compare=False):
+    model, label_encoder, _ = load_or_train_model(NSLKDD_FILE)
 
     print("[*] Loading unlabeled data from output_features.csv...")
     X_unlabeled = load_unlabeled_data(UNLABELED_FILE)
 
+    if rules_path:
+        # Les lignes couvertes par les règles certaines ne passent pas par la forêt
+        from rule_fastpath import RuleFastPath, benchmark
+        model = RuleFastPath.from_file(rules_path, model, FEATURE_COLUMNS, label_encoder)
+        print(f"[*] {model.n_rules} certain rules loaded from {rules_path}")
+        if compare:
+            benchmark(model, X_unlabeled)
+
     print("[*] Predicting labels...")
     predictions = model.predict(X_unlabeled)
     decoded = label_encoder.inverse_transform(predictions)
@@ -70,5 +145,37 @@ def main():
     for i, label in enumerate(decoded):
         print(f"Sample {i+1}: {label}")
 
+def batch(input_path, output_path, chunksize, n_jobs, shared_model=False, rules_path=None):
+    """Batch mode: stream a large CSV through a process pool into a label file."""
+    from batch_scoring import score_file
+
+    _, _, cache_dir = load_or_train_model(NSLKDD_FILE)
+    # Workers load the cached artifact; with shared_model they memory-map
+    # the flat node arrays and share one copy of the forest in RAM
+    model_path = os.path.join(cache_dir, "flat" if shared_model else "model.joblib")
+    score_file(model_path, os.path.join(cache_dir, "label_encoder.joblib"),
+               input_path, output_path, chunksize=chunksize, n_jobs=n_jobs,
+               feature_columns=FEATURE_COLUMNS, rules_path=rules_path)
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train on NSL-KDD and classify extracted flows")
+    parser.add_argument("--batch", metavar="INPUT_CSV",
+                        help="score a large CSV in chunks on a process pool")
+    parser.add_argument("--output", default="labels.csv",
+                        help="label file written in batch mode (.csv or .parquet)")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes in batch mode (default: all cores)")
+    parser.add_argument("--shared-model", action="store_true",
+                        help="batch workers memory-map one shared copy of the cached forest")
+    parser.add_argument("--rules", metavar="RULES_FILE",
+                        help="label the rows covered by these certain rules without the forest "
+                             "(e.g. certain_rules.txt)")
+    parser.add_argument("--compare", action="store_true",
+                        help="with --rules, report coverage, agreement and speedup vs the forest")
+    args = parser.parse_args()
+
+    if args.batch:
+        batch(args.batch, args.output, args.chunksize, args.jobs, args.shared_model, args.rules)
+    else:
+        main(args.rules, args.compare)
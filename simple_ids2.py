@@ -1,6 +1,9 @@
-import pandas as pd
+import argparse
+
 import joblib
 
+from dataset import load_dataset
+
 # --- Configuration ---
 FEATURE_COLUMNS = [
     'src_bytes', 'dst_bytes', 'rerror_rate', 'dst_host_count',
@@ -14,13 +17,36 @@ ENCODER_PATH = "label_encoder.pkl"
 
 # --- Load unlabeled feature data ---
 def load_unlabeled_data(filepath):
-    df = pd.read_csv(filepath)
-    missing = [col for col in FEATURE_COLUMNS if col not in df.columns]
-    if missing:
-        raise ValueError(f"Missing required columns: {missing}")
-    return df[FEATURE_COLUMNS]
+    return load_dataset(filepath, FEATURE_COLUMNS, target=None, use_cache=False)
+
+def serve(host, port, max_batch, max_wait_ms, flat=False, rules_path=None):
+    """Resident mode: load the model once and classify rows sent over HTTP."""
+    from ids_service import serve as serve_model
+
+    print("[*] Loading trained model and label encoder...")
+    model = joblib.load(MODEL_PATH)
+    label_encoder = joblib.load(ENCODER_PATH)
+    if flat:
+        # Same predictions, much lower per-call overhead on small batches
+        from flat_forest import FlatForest
+        model = FlatForest.from_sklearn(model)
+    if rules_path:
+        from rule_fastpath import RuleFastPath
+        model = RuleFastPath.from_file(rules_path, model, FEATURE_COLUMNS, label_encoder)
+        print(f"[*] {model.n_rules} certain rules loaded from {rules_path}")
+    print(f"[*] Serving predictions on http://{host}:{port}/predict")
+    serve_model(model, label_encoder, FEATURE_COLUMNS, host=host, port=port,
+                max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+def batch(input_path, output_path, chunksize, n_jobs, rules_path=None):
+    """Batch mode: stream a large CSV through a process pool into a label file."""
+    from batch_scoring import score_file
+
+    score_file(MODEL_PATH, ENCODER_PATH, input_path, output_path,
+               chunksize=chunksize, n_jobs=n_jobs, feature_columns=FEATURE_COLUMNS,
+               rules_path=rules_path)
 
-def main():
+def main(rules_path=None, compare=False):
     print("[*] Loading trained model...")
     model = joblib.load(MODEL_PATH)
 
@@ -30,6 +56,14 @@ def main():
     print("[*] Loading unlabeled feature data...")
     X_unlabeled = load_unlabeled_data(UNLABELED_FILE)
 
+    if rules_path:
+        # Les lignes couvertes par les règles certaines ne passent pas par la forêt
+        from rule_fastpath import RuleFastPath, benchmark
+        model = RuleFastPath.from_file(rules_path, model, FEATURE_COLUMNS, label_encoder)
+        print(f"[*] {model.n_rules} certain rules loaded from {rules_path}")
+        if compare:
+            benchmark(model, X_unlabeled)
+
     print("[*] Predicting...")
     predictions = model.predict(X_unlabeled)
     decoded_predictions = label_encoder.inverse_transform(predictions)
@@ -39,4 +73,34 @@ def main():
         print(f"Sample {i+1}: {label}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Classify flows with the corrected RandomForest")
+    parser.add_argument("--serve", action="store_true",
+                        help="run as a resident HTTP inference service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--max-batch", type=int, default=256,
+                        help="maximum rows per micro-batch (serve mode)")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="maximum time a request waits for its batch to fill (serve mode)")
+    parser.add_argument("--flat", action="store_true",
+                        help="predict with the flat-array forest evaluator (serve mode)")
+    parser.add_argument("--batch", metavar="INPUT_CSV",
+                        help="score a large CSV in chunks on a process pool")
+    parser.add_argument("--output", default="labels.csv",
+                        help="label file written in batch mode (.csv or .parquet)")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes in batch mode (default: all cores)")
+    parser.add_argument("--rules", metavar="RULES_FILE",
+                        help="label the rows covered by these certain rules without the forest "
+                             "(e.g. certain_rules.txt)")
+    parser.add_argument("--compare", action="store_true",
+                        help="with --rules, report coverage, agreement and speedup vs the forest")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.host, args.port, args.max_batch, args.max_wait_ms, args.flat, args.rules)
+    elif args.batch:
+        batch(args.batch, args.output, args.chunksize, args.jobs, args.rules)
+    else:
+        main(args.rules, args.compare)
@@ -0,0 +1,165 @@
+"""
+Parallel sweep of the uncertain-rule threshold and the weight multiplier.
+
+The clients hard-code split_rules(..., 0.5) and a 1.5x (2.0x) weight per
+matching corrected rule. This runs the client pipeline once up to the
+expensive shared steps, then evaluates a grid of (threshold, multiplier)
+configurations in parallel:
+
+  - the dataset load, the baseline forest fit and the rule counts are done
+    once, and cached on disk with joblib.Memory (--cache-dir) across runs;
+  - per threshold, the uncertain rules, their corrections and the number of
+    corrected rules matching each training row are computed once;
+  - per multiplier, the weights are multiplier ** matches (what
+    compute_sample_weights computes, up to rounding) and only the retrain is run, one
+    configuration per worker.
+
+Corrections come from the server (--url, one /correct_rules call per
+threshold) or from the stored rules file uploaded on chain, matched like
+the server does (--rules-file, default certain_rules.txt from
+extract_rules.py).
+
+    python sweep.py --synthetic 30000 --thresholds 0.3 0.5 0.7 --multipliers 1.2 1.5 2.0
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import requests
+from joblib import Memory, Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from dataset import FEATURE_COLUMNS, TARGET_COLUMN, load_dataset, make_synthetic
+from incremental import retrain
+from rule_extraction import count_forest_rules, split_rules
+from rule_index import RuleIndex
+from rule_weights import rule_match_counts
+
+
+def fit_baseline(X_train, y_train, trees, seed):
+    """Baseline forest of the clients (step 3) and its rule counts (step 4)."""
+    rf = RandomForestClassifier(n_estimators=trees, random_state=seed, n_jobs=-1)
+    rf.fit(X_train, y_train)
+    return rf, count_forest_rules(rf, list(X_train.columns), prefixes=True)
+
+
+def corrected_for(uncertain, url=None, index=None):
+    """
+    Corrected rules for `uncertain`, from the server or the local index.
+    Only the rules matched by this request are used, not the server's
+    all_corrected_rules, which accumulates the earlier requests and would
+    leak other configurations into this one.
+    """
+    if url:
+        resp = requests.post(url, json={'uncertain_rules': uncertain})
+        resp.raise_for_status()
+        return list(dict.fromkeys(resp.json().get('corrected_rules', [])))
+    return list(dict.fromkeys(
+        r for ur in uncertain for r in index.match(ur.split(" then")[0].strip())))
+
+
+def evaluate(baseline, X_train, y_train, X_test, y_test, matches, corrected,
+             threshold, multiplier, mode, params):
+    """Retrain with one (threshold, multiplier) configuration; one result row."""
+    start = time.perf_counter()
+    weights = np.power(float(multiplier), matches)
+    model = retrain(baseline, X_train, y_train, weights, corrected, mode=mode,
+                    feature_names=list(X_train.columns), **params)
+    fit_time = time.perf_counter() - start
+    return {
+        'threshold': threshold,
+        'multiplier': multiplier,
+        'accuracy': accuracy_score(y_test, model.predict(X_test)),
+        'retrain_seconds': fit_time,
+        'corrected_rules': len(corrected),
+        'weighted_rows': int((matches > 0).sum()),
+    }
+
+
+def sweep(X, y, thresholds, multipliers, trees=100, retrain_trees=200, mode='full',
+          url=None, rules_file='certain_rules.txt', n_jobs=-1, cache_dir='sweep_cache',
+          seed=42):
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=seed)
+    memory = Memory(cache_dir, verbose=0)
+
+    start = time.perf_counter()
+    baseline, counts = memory.cache(fit_baseline)(X_train, y_train, trees, seed)
+    acc_base = accuracy_score(y_test, baseline.predict(X_test))
+    print(f"Forêt de base + comptage des règles : {time.perf_counter() - start:.2f}s "
+          f"(accuracy {acc_base:.4f}, {len(counts)} règles)")
+
+    index = None
+    if not url:
+        with open(rules_file) as f:
+            index = RuleIndex([line.strip() for line in f if line.strip()])
+
+    # Artefacts par seuil, partagés par tous les multiplicateurs
+    per_threshold = {}
+    for threshold in thresholds:
+        start = time.perf_counter()
+        _, uncertain = split_rules(counts, len(baseline.estimators_), threshold)
+        corrected = corrected_for(uncertain, url, index)
+        matches = rule_match_counts(X_train, corrected)
+        per_threshold[threshold] = (corrected, matches)
+        print(f"seuil {threshold}: {len(uncertain)} incertaines, {len(corrected)} corrigées "
+              f"({time.perf_counter() - start:.2f}s)")
+    if not any(corrected for corrected, _ in per_threshold.values()):
+        # Toutes les configurations réentraîneraient avec des poids à 1
+        raise RuntimeError("No uncertain rule matched a stored rule: every configuration "
+                           "would retrain with unit weights")
+
+    params = dict(n_estimators=retrain_trees, max_depth=10, class_weight='balanced',
+                  random_state=seed, n_jobs=1)
+    start = time.perf_counter()
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate)(baseline, X_train, y_train, X_test, y_test,
+                          per_threshold[t][1], per_threshold[t][0], t, m, mode, params)
+        for t in thresholds for m in multipliers
+    )
+    wall = time.perf_counter() - start
+
+    print(f"\n{len(results)} configurations en {wall:.2f}s "
+          f"(accuracy de base {acc_base:.4f})")
+    print(f"{'seuil':>6} {'mult.':>6} {'corrigées':>10} {'lignes pondérées':>17} "
+          f"{'retrain (s)':>12} {'accuracy':>9} {'gain':>8}")
+    for r in sorted(results, key=lambda r: -r['accuracy']):
+        print(f"{r['threshold']:>6} {r['multiplier']:>6} {r['corrected_rules']:>10} "
+              f"{r['weighted_rows']:>17} {r['retrain_seconds']:12.2f} {r['accuracy']:9.4f} "
+              f"{r['accuracy'] - acc_base:+8.4f}")
+    return {'baseline_accuracy': acc_base, 'sweep_seconds': wall, 'results': results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep uncertain-rule thresholds and weight multipliers")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--data", default="processed_nsl_kdd_normal_malicious.csv")
+    source.add_argument("--synthetic", type=int, metavar="ROWS",
+                        help="use a synthetic NSL-KDD shaped dataset instead of --data")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.3, 0.4, 0.5, 0.6, 0.7])
+    parser.add_argument("--multipliers", type=float, nargs="+", default=[1.2, 1.5, 2.0, 3.0])
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--retrain-trees", type=int, default=200)
+    parser.add_argument("--retrain", default="full", choices=['full', 'warm_start', 'touched'])
+    correction = parser.add_mutually_exclusive_group()
+    correction.add_argument("--url", help="server /correct_rules URL")
+    correction.add_argument("--rules-file", default="certain_rules.txt",
+                            help="stored rules matched locally like the server")
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--cache-dir", default="sweep_cache")
+    parser.add_argument("--output", default="sweep_results.json")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        df = make_synthetic(args.synthetic)
+    else:
+        df = load_dataset(args.data, FEATURE_COLUMNS, TARGET_COLUMN)
+    report = sweep(df[FEATURE_COLUMNS], df[TARGET_COLUMN], args.thresholds, args.multipliers,
+                   args.trees, args.retrain_trees, args.retrain, args.url, args.rules_file,
+                   args.jobs, args.cache_dir)
+    report['args'] = vars(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRésultats écrits dans {args.output}")
@@ -42,21 +42,16 @@ if __name__ == "__main__":
 
 
 
-from web3 import Web3
-
-# --- Connect to Ganache ---
-ganache_url = "http://127.0.0.1:8545"
-web3 = Web3(Web3.HTTPProvider(ganache_url))
-
-# Check connection
-if not web3.is_connected():
-    raise Exception("Cannot connect to Ganache at " + ganache_url)
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-# Set default account (you can change the index if needed)
-accounts = web3.eth.accounts
-if not accounts:
-    raise Exception("No accounts found on the node; is Ganache running unlocked?")
-web3.eth.default_account = accounts[0]
+import chain_backend
+import merkle_anchor
 
 # --- Manually paste your ABI here ---
 abi = [
@@ -186,16 +181,36 @@ abi = [
     }
   ]
 # --- Set your deployed contract address here ---
-contract_address = "0x0cC5bE6513a41a4C3492BAca918659E24aD870bC"
-contract = web3.eth.contract(address=contract_address, abi=abi)
+contract_address = os.environ.get("RULES_CONTRACT_ADDRESS",
+                                  "0x0cC5bE6513a41a4C3492BAca918659E24aD870bC")
+
+# --- Connect to Ganache ---
+# (CHAIN_URL to change the node; CHAIN_BACKEND=memory or sqlite:<path> runs
+# against the simulated chain of chain_backend.py). The first account is
+# the default sender.
+web3, contract = chain_backend.connect(contract_address, abi)
+accounts = web3.eth.accounts
 
 # --- Read and Upload Rules ---
-def upload_rules(file_path: str):
+def read_rules(file_path: str) -> list:
+    """
+    Non-empty lines of a rules file. A line starting with the Merkle
+    anchor prefix is refused: readers would take it for an anchor.
+    """
     try:
         with open(file_path, 'r') as f:
             lines = [line.strip() for line in f if line.strip()]
     except FileNotFoundError:
         raise FileNotFoundError(f"Rules file not found: {file_path}")
+    for line in lines:
+        if line.startswith(merkle_anchor.ANCHOR_PREFIX):
+            raise ValueError(f"Rule {line!r} starts with the reserved anchor prefix "
+                             f"{merkle_anchor.ANCHOR_PREFIX!r}")
+    return lines
+
+
+def upload_rules(file_path: str):
+    lines = read_rules(file_path)
 
     for line in lines:
         tx_hash = contract.functions.addRule(line).transact()
@@ -205,5 +220,206 @@ def upload_rules(file_path: str):
     total = contract.functions.getRuleCount().call()
     print(f"Total rules uploaded: {total}")
 
+
+# --- Bulk upload: pipelined transactions, skip rules already on chain ---
+UPLOADED_CACHE_PATH = f"uploaded_rules_{contract_address}.json"
+
+
+def rule_hash(rule: str) -> str:
+    return hashlib.sha256(rule.strip().encode('utf-8')).hexdigest()
+
+
+# Version 2 : les hashes couvrent aussi les règles des lots ancrés
+CACHE_FORMAT = 2
+
+
+def load_onchain_hashes(path: str = UPLOADED_CACHE_PATH,
+                        blob_dir: str = merkle_anchor.BLOB_DIR) -> set:
+    """
+    Return the set of hashes of the rules already stored in the contract.
+
+    An anchored batch contributes the hash of its anchor and the hashes
+    of its rules, read from the blob store `blob_dir`; a batch whose
+    blob is missing or does not verify contributes its anchor only.
+    The hashes are cached locally together with the number of on-chain
+    indices they cover, so only rules added since the last run are read
+    back with getRule.
+    """
+    store = merkle_anchor.BlobStore(blob_dir)
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = {}
+    if cache.get('contract') != contract_address or cache.get('format') != CACHE_FORMAT:
+        cache = {}
+    hashes = set(cache.get('hashes', []))
+    count = cache.get('count', 0)
+
+    total = contract.functions.getRuleCount().call()
+    if count > total:
+        # The contract was redeployed or reset: rebuild the cache
+        hashes, count = set(), 0
+    for i in range(count, total):
+        entry = contract.functions.getRule(i).call()
+        hashes.add(rule_hash(entry))
+        if merkle_anchor.is_anchor(entry.strip()):
+            try:
+                hashes.update(rule_hash(r) for r in
+                              merkle_anchor.resolve_anchor(entry.strip(), store))
+            except (KeyError, ValueError) as e:
+                print(f"Warning: rules of anchored batch {i} not read: {e}")
+
+    save_onchain_hashes(hashes, total, path)
+    return hashes
+
+
+def save_onchain_hashes(hashes: set, count: int, path: str = UPLOADED_CACHE_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'contract': contract_address, 'format': CACHE_FORMAT, 'count': count,
+                   'hashes': sorted(hashes)}, f)
+    os.replace(tmp_path, path)
+
+
+def upload_rules_bulk(file_path: str, n_accounts: int = 1, window: int = 64,
+                      blob_dir: str = merkle_anchor.BLOB_DIR):
+    """
+    Upload the rules of `file_path` without waiting for each confirmation.
+
+    Transactions are sent back-to-back with locally managed nonces,
+    round-robin over the first `n_accounts` node accounts, and their
+    receipts are collected by a thread pool with at most `window`
+    transactions in flight. Rules whose hash is already on chain are
+    skipped, including the rules of anchored batches found in
+    `blob_dir`, so after a partial failure the same command resumes
+    where it stopped. With several accounts the on-chain order of the rules
+    may differ from the file order.
+
+    The hash cache is then refreshed by reading back every index added
+    since its last count, not from the receipts: a transaction can be
+    mined although its receipt failed or timed out, and other writers
+    may have added rules meanwhile.
+    """
+    lines = read_rules(file_path)
+
+    known = load_onchain_hashes(blob_dir=blob_dir)
+    todo, seen = [], set()
+    for line in lines:
+        h = rule_hash(line)
+        if h not in known and h not in seen:
+            seen.add(h)
+            todo.append(line)
+    print(f"{len(lines) - len(todo)} rules already on chain, {len(todo)} to upload")
+
+    senders = accounts[:max(1, n_accounts)]
+    nonces = {a: web3.eth.get_transaction_count(a, 'pending') for a in senders}
+
+    def wait_receipt(tx_hash):
+        return web3.eth.wait_for_transaction_receipt(tx_hash)
+
+    confirmed, failed = 0, None
+    pending = deque()
+
+    def collect_oldest():
+        nonlocal confirmed, failed
+        line, future = pending.popleft()
+        try:
+            receipt = future.result()
+        except Exception as e:
+            failed = failed or f"{line!r}: {e}"
+            return
+        if receipt.status != 1:
+            failed = failed or f"{line!r}: transaction reverted"
+            return
+        confirmed += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, window)) as pool:
+        for i, line in enumerate(todo):
+            if failed:
+                break
+            sender = senders[i % len(senders)]
+            try:
+                tx_hash = contract.functions.addRule(line).transact(
+                    {'from': sender, 'nonce': nonces[sender]})
+            except Exception as e:
+                failed = f"{line!r}: {e}"
+                break
+            nonces[sender] += 1
+            pending.append((line, pool.submit(wait_receipt, tx_hash)))
+            if len(pending) >= window:
+                collect_oldest()
+        while pending:
+            collect_oldest()
+    elapsed = time.perf_counter() - start
+
+    # Relecture des indices ajoutés depuis le dernier comptage
+    load_onchain_hashes(blob_dir=blob_dir)
+    rate = confirmed / elapsed if elapsed > 0 else 0.0
+    print(f"Uploaded {confirmed}/{len(todo)} rules in {elapsed:.2f}s "
+          f"({rate:.1f} rules/sec)")
+    if failed:
+        raise Exception(f"Bulk upload stopped after a failure ({failed}); "
+                        f"run it again to resume")
+
+    total = contract.functions.getRuleCount().call()
+    print(f"Total rules uploaded: {total}")
+
+
+# --- Anchored upload: one transaction for a whole rule file ---
+def upload_rules_anchored(file_path: str, blob_dir: str = merkle_anchor.BLOB_DIR):
+    """
+    Store the rules of `file_path` as one batch in the local blob store
+    `blob_dir` and write only its Merkle anchor on chain, with a single
+    addRule transaction (see merkle_anchor.py). The server must be able
+    to read `blob_dir` (RULE_BLOB_DIR) to load the batch. Uploading the
+    same file again is a no-op.
+    """
+    lines = list(dict.fromkeys(read_rules(file_path)))
+    if not lines:
+        print("No rules to upload")
+        return
+
+    anchor = merkle_anchor.make_anchor(lines, merkle_anchor.BlobStore(blob_dir))
+    known = load_onchain_hashes(blob_dir=blob_dir)
+    if rule_hash(anchor) in known:
+        print(f"Batch of {len(lines)} rules already anchored: {anchor}")
+        return
+
+    start = time.perf_counter()
+    tx_hash = contract.functions.addRule(anchor).transact()
+    receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+    if receipt.status != 1:
+        raise Exception(f"Anchor transaction reverted: {anchor}")
+    load_onchain_hashes(blob_dir=blob_dir)
+    total = contract.functions.getRuleCount().call()
+    print(f"Anchored {len(lines)} rules in 1 transaction ({time.perf_counter() - start:.2f}s): "
+          f"{anchor}")
+    print(f"Total on-chain entries: {total}")
+
+
 if __name__ == "__main__":
-    upload_rules("certain_rules.txt")
+    parser = argparse.ArgumentParser(description="Upload rules to the RandomForestRules contract")
+    parser.add_argument("rules_file", nargs="?", default="certain_rules.txt")
+    parser.add_argument("--bulk", action="store_true",
+                        help="pipelined upload, skipping rules already on chain")
+    parser.add_argument("--anchor", action="store_true",
+                        help="store the rules in the blob store and anchor their Merkle root "
+                             "on chain in a single transaction")
+    parser.add_argument("--blob-dir", default=merkle_anchor.BLOB_DIR,
+                        help="blob store directory (anchor mode; bulk mode reads it to "
+                             "skip rules of anchored batches)")
+    parser.add_argument("--accounts", type=int, default=1,
+                        help="number of node accounts to spread transactions over (bulk mode)")
+    parser.add_argument("--window", type=int, default=64,
+                        help="maximum number of unconfirmed transactions (bulk mode)")
+    args = parser.parse_args()
+
+    if args.anchor:
+        upload_rules_anchored(args.rules_file, args.blob_dir)
+    elif args.bulk:
+        upload_rules_bulk(args.rules_file, n_accounts=args.accounts, window=args.window,
+                          blob_dir=args.blob_dir)
+    else:
+        upload_rules(args.rules_file)
@@ -0,0 +1,68 @@
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:  # msgpack est optionnel : JSON reste le format par défaut
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+# En dessous de cette taille, compresser coûte plus que ça ne rapporte
+GZIP_MIN_SIZE = 1024
+
+
+def read_body(request):
+    """Raw request body, gunzipped if the client sent Content-Encoding: gzip."""
+    raw = request.get_data()
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        try:
+            raw = gzip.decompress(raw)
+        except OSError as e:
+            raise ValueError(f"invalid gzip body: {e}")
+    return raw
+
+
+def decode_body(raw, mimetype):
+    """Decode a JSON or msgpack request body (empty body -> {})."""
+    if not raw:
+        return {}
+    if mimetype == MSGPACK_MIMETYPE:
+        if msgpack is None:
+            raise ValueError("msgpack bodies are not supported (msgpack not installed)")
+        try:
+            return msgpack.unpackb(raw, raw=False)
+        except Exception as e:
+            raise ValueError(f"invalid msgpack body: {e}")
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"invalid JSON body: {e}")
+
+
+def response_format(request):
+    """
+    (mimetype, gzip) negotiated from the Accept and Accept-Encoding
+    headers: msgpack only when asked for and available, JSON otherwise.
+    """
+    mimetype = JSON_MIMETYPE
+    if msgpack is not None:
+        best = request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE])
+        if best == MSGPACK_MIMETYPE:
+            mimetype = MSGPACK_MIMETYPE
+    use_gzip = 'gzip' in request.accept_encodings
+    return mimetype, use_gzip
+
+
+def encode_body(payload, mimetype, use_gzip):
+    """
+    Serialize `payload` for the wire. Returns (body, content_encoding),
+    content_encoding being None when the body is not compressed.
+    """
+    if mimetype == MSGPACK_MIMETYPE:
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    if use_gzip and len(body) >= GZIP_MIN_SIZE:
+        return gzip.compress(body, compresslevel=5), 'gzip'
+    return body, None